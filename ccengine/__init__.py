@@ -0,0 +1,43 @@
+''' ccengine
+
+The chord engine: fingering search, filters, scales, chord identification and capo
+math.  Pure python with no Pythonista (ui, console, sound) imports and no global
+state, everything a function needs is passed in, so it can be used from the command
+line, worker processes or tests as well as from chordcalc.
+
+	fingering    Fingering records, LRUCache and LazySequence
+	theory       pitch class sets, scales on the neck and chord identification
+	capos        string offsets for the applied capos
+	numpyEngine  optional vectorized candidate search
+	search       FingeringSearch and the process pool helpers
+	filters      fingering filters and playability ranking
+	database     the precomputed fingering database
+	midi         chord timelines of MIDI files, python -m ccengine.midi
+	audio        chord recognition from WAV recordings (numpy), python -m ccengine.audio
+
+and a benchmark of them over the catalog, python -m ccengine.benchmark
+'''
+
+# in dependency order, for reloading in Pythonista
+MODULES = ['fingering', 'theory', 'capos', 'numpyEngine', 'search', 'filters', 'database', 'midi', 'audio']
+
+# numpyEngine and audio use numpy, they are left to be imported when they are used
+# (import ccengine.audio) so the engine imports in milliseconds without them.  midi is
+# a command line tool, like benchmark, importing it here would upset python -m
+from . import fingering, theory, capos, search, filters, database
+
+from .fingering import Fingering, fingeringKey, LRUCache, LazySequence
+from .theory import (pitchClassSet, inPitchClassSet, scaleIntervalSteps, scalePitchClasses,
+											scaleOnNeck, chordScaleOnNeck, twoOctaveScale, ChordIndex, identifyChords)
+from .capos import capoOffsets
+from .search import FingeringSearch, ShapeCache, parallelFingerings
+from .filters import (compile_filters, apply_filters, NarrowedSequence, playabilityScore,
+											rankFingerings, PLAYABILITY_WEIGHTS)
+
+# what chordcalc takes with from ccengine import *, the modules themselves stay ccengine.<module>
+__all__ = ['Fingering', 'fingeringKey', 'LRUCache', 'LazySequence',
+					'pitchClassSet', 'inPitchClassSet', 'scaleIntervalSteps', 'scalePitchClasses',
+					'scaleOnNeck', 'chordScaleOnNeck', 'twoOctaveScale', 'ChordIndex', 'identifyChords',
+					'capoOffsets', 'FingeringSearch', 'ShapeCache', 'parallelFingerings',
+					'compile_filters', 'apply_filters', 'NarrowedSequence', 'playabilityScore',
+					'rankFingerings', 'PLAYABILITY_WEIGHTS']
@@ -0,0 +1,215 @@
+''' ccengine.audio
+
+Chord recognition from WAV recordings, the identify mode chords of a recording as a
+timeline, like ccengine.midi.
+
+	python -m ccengine.audio recording.wav [more.wav ...] [-o timeline.json] [--csv]
+
+The recording is read CHUNK_FRAMES analysis frames at a time, so memory is bounded
+whatever its length.  Each chunk is block averaged down to about TARGET_RATE, cut into
+overlapping Hann windowed frames (a strided view, no copies), and the whole chunk of
+frames is transformed with one rfft.  The power of each bin between MIN_FREQ and
+MAX_FREQ is summed into its pitch class with a single (bins x 12) matrix product, the
+chromagram, and the bins below BASS_FREQ the same way for the bass.  A frame's notes
+are the pitch classes within THRESHOLD of its strongest, at most MAX_NOTES of them.
+waveNotes does the same for the chroma summed over a whole recording, for identify mode.
+
+numpy is optional for the rest of the engine, if it isn't installed, available is False.
+It is imported on first use, like numpyEngine.
+'''
+
+import wave, argparse
+import chordcalc_constants
+from .database import catalog
+from .midi import ChordNamer, writeTimelines
+from .numpyEngine import available, loadNumpy
+
+TARGET_RATE = 22050     # Hz, the rate frames are analysed at, higher rates are averaged down
+FRAME_SIZE = 8192       # samples at the analysis rate, 2.7 Hz bins
+HOP_SIZE = 2048         # samples between frames, 75% overlap
+CHUNK_FRAMES = 64       # frames transformed together
+MIN_FREQ = 60.0         # Hz, below this the bins are too coarse for semitones
+MAX_FREQ = 5000.0
+BASS_FREQ = 260.0       # Hz, the bass note is the strongest pitch class below this (about C4)
+THRESHOLD = 0.25        # a pitch class is a note if its power is at least this of the strongest
+MAX_NOTES = 6
+SILENCE = 1e-6          # mean square (full scale 1.0) of a frame with no chord
+HOLD = 2                # frames a new chord must last before the timeline changes to it
+
+def readSamples(path,blockSeconds):
+	''' (rate, blocks), blocks of the recording as float mono samples in -1..1, each of
+	blockSeconds'''
+	np = loadNumpy()
+	fh = wave.open(path,'rb')
+	channels,width,rate = fh.getnchannels(),fh.getsampwidth(),fh.getframerate()
+	blockFrames = max(1,int(rate*blockSeconds))
+	if width not in (1,2,4):
+		fh.close()
+		raise ValueError('{}: {} bit samples are not supported'.format(path,8*width))
+	def blocks():
+		try:
+			while True:
+				data = fh.readframes(blockFrames)
+				if not data:
+					return
+				if width == 1:
+					samples = (np.frombuffer(data,dtype=np.uint8).astype(np.float32) - 128)/128.0
+				else:
+					dtype = np.int16 if width == 2 else np.int32
+					samples = np.frombuffer(data,dtype=dtype).astype(np.float32)/float(2**(8*width - 1))
+				if channels > 1:
+					samples = samples[:len(samples) - len(samples) % channels].reshape(-1,channels).mean(axis=1)
+				yield samples
+		finally:
+			fh.close()
+	return rate,blocks()
+
+
+class Chromagram(object):
+	''' the chroma of the frames of a recording at rate'''
+	def __init__(self,rate,frameSize=FRAME_SIZE,hopSize=HOP_SIZE):
+		np = loadNumpy()
+		self.decimation = max(1,int(rate // TARGET_RATE))
+		self.rate = float(rate)/self.decimation
+		self.frameSize = frameSize
+		self.hopSize = hopSize
+		self.window = np.hanning(frameSize).astype(np.float32)
+		freqs = np.fft.rfftfreq(frameSize,1.0/self.rate)
+		self.bins = np.nonzero((freqs >= MIN_FREQ) & (freqs <= MAX_FREQ))[0]
+		pitchClasses = np.round(12*np.log2(freqs[self.bins]/440.0) + 69).astype(int) % 12
+		self.chroma = np.zeros((len(self.bins),12),dtype=np.float32)
+		self.chroma[np.arange(len(self.bins)),pitchClasses] = 1
+		self.bass = self.chroma * (freqs[self.bins] < BASS_FREQ)[:,np.newaxis]
+
+	def frames(self,blocks):
+		''' (seconds, chroma, bass chroma, mean square) for each frame, chroma is 12 powers.
+		The samples after the last whole frame are zero padded to one more frame, and
+		duration is the length of the recording once the last frame is yielded'''
+		np = loadNumpy()
+		pending = np.zeros(0,dtype=np.float32)  # samples at the analysis rate not yet a whole hop
+		tail = np.zeros(0,dtype=np.float32)     # raw samples short of a whole decimation block
+		frame = 0
+		samples = 0
+		for block in blocks:
+			samples += len(block)
+			if self.decimation > 1:
+				block = np.concatenate((tail,block))
+				usable = len(block) - len(block) % self.decimation
+				tail = block[usable:]
+				block = block[:usable].reshape(-1,self.decimation).mean(axis=1)
+			pending = np.concatenate((pending,block))
+			count = (len(pending) - self.frameSize)//self.hopSize + 1
+			if count <= 0:
+				continue
+			for item in self.analyse(pending,count,frame):
+				yield item
+			frame += count
+			pending = pending[count*self.hopSize:]
+		self.duration = samples/(self.rate*self.decimation)
+		covered = self.frameSize - self.hopSize if frame else 0 # by the frames already yielded
+		if len(pending) > covered:
+			pending = np.concatenate((pending,np.zeros(self.frameSize - len(pending),dtype=np.float32)))
+			for item in self.analyse(pending,1,frame):
+				yield item
+				
+	def analyse(self,samples,count,frame):
+		''' the frames items for count frames of samples, the first is frame number frame'''
+		np = loadNumpy()
+		stride = samples.strides[0]
+		windows = np.lib.stride_tricks.as_strided(samples,shape=(count,self.frameSize),
+										strides=(self.hopSize*stride,stride))
+		power = np.abs(np.fft.rfft(windows*self.window,axis=1)[:,self.bins])**2
+		chroma = power.dot(self.chroma)
+		bass = power.dot(self.bass)
+		energy = (windows**2).mean(axis=1)
+		for n in range(count):
+			yield (frame + n)*self.hopSize/self.rate,chroma[n],bass[n],energy[n]
+
+def dominantNotes(chroma,bass):
+	''' (pitch class set, bass pitch class or None) of a frame's chroma'''
+	np = loadNumpy()
+	strongest = chroma.max()
+	if strongest <= 0:
+		return 0,None
+	order = np.argsort(chroma)[::-1][:MAX_NOTES]
+	pcs = 0
+	for pc in order:
+		if chroma[pc] >= THRESHOLD*strongest:
+			pcs |= 1 << int(pc)
+	low = int(np.argmax(bass))
+	if bass[low] <= 0 or not (pcs >> low) & 1:
+		low = None
+	return pcs,low
+
+def waveNotes(path):
+	''' (pitch classes, bass pitch class or None) of a whole recording, from the chroma of
+	all its frames that are not silent, for identifying a single chord'''
+	np = loadNumpy()
+	rate,blocks = readSamples(path,CHUNK_FRAMES*HOP_SIZE/float(TARGET_RATE))
+	total = np.zeros(12)
+	totalBass = np.zeros(12)
+	for seconds,chroma,bass,energy in Chromagram(rate).frames(blocks):
+		if energy >= SILENCE:
+			total += chroma
+			totalBass += bass
+	pcs,low = dominantNotes(total,totalBass)
+	return [pc for pc in range(12) if (pcs >> pc) & 1],low
+
+def waveTimeline(path,namer,hold=HOLD):
+	''' the timeline entries {file, start, end, chord, ...} of a WAV recording, as each is
+	completed.  Silence ends an entry, a change of chord has to last hold frames, or
+	to the end of the recording'''
+	rate,blocks = readSamples(path,CHUNK_FRAMES*HOP_SIZE/float(TARGET_RATE))
+	chromagram = Chromagram(rate)
+	current = None  # the entry being extended
+	pending = None  # (chord, start, frames, name) of a change not yet held long enough
+	seconds = 0.0
+	for seconds,chroma,bass,energy in chromagram.frames(blocks):
+		name = None
+		if energy >= SILENCE:
+			pcs,low = dominantNotes(chroma,bass)
+			if pcs:
+				name = namer.namePitchClasses(pcs,low)
+		chord = name['chord'] if name else None
+		if chord == (current['chord'] if current else None):
+			pending = None
+			continue
+		if pending and pending[0] == chord:
+			pending = (chord,pending[1],pending[2] + 1,name)
+		else:
+			pending = (chord,seconds,1,name)
+		if pending[2] >= hold:
+			if current:
+				current['end'] = round(pending[1],4)
+				yield current
+			current = None
+			if name:
+				current = {'file':path, 'start':round(pending[1],4), 'end':None}
+				current.update(name)
+			pending = None
+	if pending and pending[3]: # a change in the last frames ends the recording, held or not
+		if current:
+			current['end'] = round(pending[1],4)
+			yield current
+		current = {'file':path, 'start':round(pending[1],4), 'end':None}
+		current.update(pending[3])
+	if current: # to the end of the recording
+		current['end'] = round(chromagram.duration,4)
+		yield current
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='name the chords of WAV recordings')
+	parser.add_argument('files',nargs='+',help='WAV files, mono or mixed down to mono')
+	parser.add_argument('-o','--output',help='write the timeline here instead of to stdout')
+	parser.add_argument('--csv',action='store_true',help='CSV rows instead of JSON')
+	parser.add_argument('--hold',type=int,default=HOLD,help='frames a new chord must last')
+	args = parser.parse_args(argv)
+	if not available:
+		parser.error('numpy is not installed')
+	tunings,chords = catalog()
+	namer = ChordNamer(chords,chordcalc_constants.NOTE_NAMES)
+	writeTimelines(args.files,lambda path: waveTimeline(path,namer,args.hold),args.output,args.csv)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,284 @@
+''' ccengine.benchmark
+
+Times the engine across the instrument and chord catalog and writes the results
+as JSON, so runs can be compared to track regressions and improvements.
+
+	python -m ccengine.benchmark -o results.json [--quick] [--suites search,find]
+
+Every tuning is run through the suites below.  A case is one suite on one tuning
+with one set of options, its samples are the individual calls, summarized as
+percentiles (in ms) with the number of items they produced (and for search, the
+candidates examined, FingeringSearch.visited):
+
+	search     the full fingering search for every chord type and root, at several
+	           spans, with representative capos and search filters
+	filters    the narrowing filters applied to the fingerings found at the default span
+	scales     the notes of every scale in every key on the neck (calc_scale_notes)
+	twooctave  two octave scales from each string, in each mode (calc_two_octave_scale)
+	find       chord identification of the first fingering of each chord (onFind), with
+	           the time to build the ChordIndex, exact, over the bass note and ranked
+	           (the FIND_LIMIT best)
+'''
+
+import sys, re, math, time, json, platform, argparse
+import chordcalc_constants
+from .fingering import Fingering
+from .theory import scaleOnNeck, twoOctaveScale, ChordIndex
+from .capos import capoOffsets
+from .search import FingeringSearch, ShapeCache
+from .filters import apply_filters
+from . import numpyEngine
+from .database import catalog, is5StringBanjo
+
+BENCHMARK_VERSION = 1
+SUITES = ['search', 'filters', 'scales', 'twooctave', 'find']
+SPAN_OFFSETS = [-1, 0, 1]   # spans searched, relative to the tuning's default
+SEARCH_FILTER_SETS = [['NOROOT_OK'], ['NO3RD_OK', 'NO5TH_OK']]
+NARROW_FILTER_SETS = [['NO_DEAD'], ['NO_OPEN', 'NO_WIDOW'], ['FULL_CHORD', 'NO_DEAD']]
+TWO_OCTAVE_MODES = ['normal', 'down', 'open', 'FourOnString']
+INSTRUMENT_TYPES = ['guitar', 'mando', 'ukulele', 'banjo']
+FIND_LIMIT = 10
+
+def instrumentType(title):
+	''' as Model.instrument_type'''
+	for type in INSTRUMENT_TYPES:
+		if re.match(type,title,flags=re.I):
+			return type
+	return 'generic'
+
+def capoSets(numStrings,banjo):
+	''' (name, capos) for the representative capos, capos are fret -> string mask'''
+	sets = [('full 2',{2:[1]*numStrings}), ('partial 2',{2:[0]+[1]*(numStrings-1)})]
+	if banjo:
+		sets.append(('5th string 7',{7:[1]}))
+	return sets
+
+def percentile(ordered,fraction):
+	''' nearest rank percentile of a sorted list'''
+	return ordered[max(0,int(math.ceil(fraction*len(ordered)))-1)]
+
+def summarize(case,times,counts,errors=0,candidates=None):
+	''' the case with its timings (seconds) and item counts summarized, and the candidates
+	examined to find them if the suite counts them'''
+	ordered = sorted(times)
+	ms = lambda seconds: round(1000*seconds,4)
+	case.update({'samples':len(times),
+				'p50':ms(percentile(ordered,0.5)),
+				'p90':ms(percentile(ordered,0.9)),
+				'p99':ms(percentile(ordered,0.99)),
+				'max':ms(ordered[-1]),
+				'mean':ms(sum(times)/len(times)),
+				'total':ms(sum(times)),
+				'count':sum(counts),
+				'countMax':max(counts),
+				'errors':errors})
+	if candidates is not None:
+		case.update({'candidates':sum(candidates), 'candidatesMax':max(candidates)})
+	return case
+
+
+class Benchmark(object):
+	''' the benchmark for one tuning, see the module doc string'''
+	def __init__(self,tuning,chords,roots,scales,engine='python',chordTypes=None):
+		self.title = tuning['title']
+		self.notes = tuning['notes']
+		self.span = tuning['span']
+		self.numFrets = tuning.get('frets',chordcalc_constants.NUM_FRETS_DEFAULT)
+		self.banjo = is5StringBanjo(self.title,self.notes)
+		self.type = instrumentType(self.title)
+		self.chords = chords
+		self.chordTypes = chordTypes or chords # identified against, onFind uses them all
+		self.roots = roots
+		self.scales = scales
+		self.engine = engine
+		self.offsets = capoOffsets({},len(self.notes),self.banjo)
+		self.found = {} # (chord number, root) -> fingerings at the default span, for filters and find
+
+	def case(self,suite,**options):
+		case = {'suite':suite, 'tuning':self.title, 'strings':len(self.notes), 'frets':self.numFrets}
+		case.update(options)
+		return case
+
+	def search(self,span,capos=None,filters=(),keep=False):
+		times = []
+		counts = []
+		visited = []
+		offsets = capoOffsets(capos or {},len(self.notes),self.banjo)
+		shapes = ShapeCache()
+		for c,chord in enumerate(self.chords):
+			for root in self.roots:
+				start = time.perf_counter()
+				search = FingeringSearch(self.notes,root,chord['fingering'],span,filters=filters,
+								capoOffsets=offsets,is5StringBanjo=self.banjo,numFrets=self.numFrets,
+								engine=self.engine,shapes=shapes)
+				fingerings = list(search.fingerings())
+				times.append(time.perf_counter() - start)
+				counts.append(len(fingerings))
+				visited.append(search.visited)
+				if keep:
+					self.found[(c,root)] = [Fingering(frets,search.getDegrees(frets),search.scaleNoteNames)
+												for frets in fingerings]
+		return times,counts,visited
+
+	def runSearch(self):
+		for offset in SPAN_OFFSETS:
+			span = max(1,self.span + offset)
+			times,counts,visited = self.search(span,keep=(offset == 0))
+			yield summarize(self.case('search',span=span,capo='none',filters=[]),times,counts,
+							candidates=visited)
+		for name,capos in capoSets(len(self.notes),self.banjo):
+			times,counts,visited = self.search(self.span,capos=capos)
+			yield summarize(self.case('search',span=self.span,capo=name,filters=[]),times,counts,
+							candidates=visited)
+		for filters in SEARCH_FILTER_SETS:
+			times,counts,visited = self.search(self.span,filters=filters)
+			yield summarize(self.case('search',span=self.span,capo='none',filters=filters),times,counts,
+							candidates=visited)
+
+	def ensureFound(self):
+		if not self.found:
+			self.search(self.span,keep=True)
+
+	def runFilters(self):
+		self.ensureFound()
+		for filters in NARROW_FILTER_SETS:
+			times = []
+			counts = []
+			for fingerings in self.found.values():
+				start = time.perf_counter()
+				narrowed = list(apply_filters(filters,fingerings,self.type) or [])
+				times.append(time.perf_counter() - start)
+				counts.append(len(narrowed))
+			yield summarize(self.case('filters',span=self.span,filters=filters),times,counts)
+
+	def runScales(self):
+		times = []
+		counts = []
+		for name,intervals in self.scales:
+			for key in range(12):
+				start = time.perf_counter()
+				notes = scaleOnNeck(self.notes,self.offsets,key,intervals,self.numFrets)
+				times.append(time.perf_counter() - start)
+				counts.append(sum([len(string) for string in notes]))
+		yield summarize(self.case('scales'),times,counts)
+
+	def runTwoOctave(self):
+		for mode in TWO_OCTAVE_MODES:
+			times = []
+			counts = []
+			errors = 0
+			for name,intervals in self.scales:
+				for key in range(12):
+					scaleNotes = scaleOnNeck(self.notes,self.offsets,key,intervals,self.numFrets)
+					for string in range(len(self.notes)-1):
+						if not scaleNotes[string]:
+							continue
+						location = (string,scaleNotes[string][0][0])
+						start = time.perf_counter()
+						try:
+							scale = twoOctaveScale(self.notes,scaleNotes,key,intervals,location,mode)
+						except (ValueError,IndexError):
+							scale = []
+							errors += 1
+						times.append(time.perf_counter() - start)
+						counts.append(len(scale))
+			if times:
+				yield summarize(self.case('twooctave',mode=mode),times,counts,errors)
+
+	def runFind(self):
+		self.ensureFound()
+		start = time.perf_counter()
+		index = ChordIndex([(chord['title'],chord['fingering']) for chord in self.chordTypes])
+		build = time.perf_counter() - start
+		noteNames = chordcalc_constants.NOTE_NAMES
+		pitches = FingeringSearch(self.notes,0,[0],self.span,is5StringBanjo=self.banjo).pitches
+		voicings = [[pitches[i] + fret for i,fret in enumerate(fingerings[0].frets) if fret != -1]
+						for fingerings in self.found.values() if fingerings]
+		identifiers = [('exact',lambda notes: index.identify(notes,noteNames)),
+					('bass',lambda notes: index.identify(notes,noteNames,min(notes))),
+					('ranked',lambda notes: index.rank(notes,noteNames,FIND_LIMIT))]
+		for mode,identify in identifiers:
+			times = []
+			counts = []
+			for notes in voicings:
+				start = time.perf_counter()
+				chords = identify(notes)
+				times.append(time.perf_counter() - start)
+				counts.append(len([chord for chord in chords if chord['root'] != -1]))
+			if times:
+				yield summarize(self.case('find',mode=mode,indexBuild=round(1000*build,4)),times,counts)
+
+	def run(self,suites):
+		runners = {'search':self.runSearch, 'filters':self.runFilters, 'scales':self.runScales,
+					'twooctave':self.runTwoOctave, 'find':self.runFind}
+		for suite in SUITES:
+			if suite in suites:
+				for case in runners[suite]():
+					yield case
+
+
+def run(suites=SUITES,quick=False,tuningPattern=None,engine='python',config=False,progress=None):
+	''' run the benchmark, returns the results as a dict ready for json.  The catalog is
+	TUNINGS and CHORDTYPE, or the app's config.ini if config'''
+	if config:
+		tunings,chords = catalog()
+	else:
+		tunings,chords = chordcalc_constants.TUNING_LIST_CLEAN,chordcalc_constants.CHORD_LIST_CLEAN
+	chordTypes = chords
+	scales = chordcalc_constants.SCALETYPE
+	roots = list(range(12))
+	if quick: # a sample of the chords, roots and scales, still every tuning
+		chords = chords[::8]
+		roots = roots[::6]
+		scales = scales[::4]
+	if tuningPattern:
+		tunings = [tuning for tuning in tunings if re.search(tuningPattern,tuning['title'],flags=re.I)]
+	started = time.time()
+	cases = []
+	for tuning in tunings:
+		for case in Benchmark(tuning,chords,roots,scales,engine,chordTypes).run(suites):
+			cases.append(case)
+			if progress:
+				progress(case)
+	return {'version':BENCHMARK_VERSION,
+			'started':time.strftime('%Y-%m-%dT%H:%M:%S',time.localtime(started)),
+			'elapsed':round(time.time() - started,3),
+			'python':platform.python_version(),
+			'platform':platform.platform(),
+			'engine':engine,
+			'quick':quick,
+			'catalog':'config.ini' if config else 'chordcalc_constants',
+			'units':'ms',
+			'tunings':len(tunings),
+			'chords':len(chords),
+			'roots':roots,
+			'cases':cases}
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='time the chord engine across the catalog')
+	parser.add_argument('-o','--output',help='write the json here instead of to stdout')
+	parser.add_argument('--suites',default=','.join(SUITES),help='comma separated, from ' + ','.join(SUITES))
+	parser.add_argument('--quick',action='store_true',help='sample the chords, roots and scales')
+	parser.add_argument('--tunings',help='only the tunings whose title matches this regex')
+	parser.add_argument('--engine',default='python',choices=['python','numpy'])
+	parser.add_argument('--config',action='store_true',help='use the catalog in config.ini')
+	args = parser.parse_args(argv)
+	suites = [suite.strip() for suite in args.suites.split(',')]
+	for suite in suites:
+		if suite not in SUITES:
+			parser.error('unknown suite {}'.format(suite))
+	if args.engine == 'numpy' and not numpyEngine.available:
+		parser.error('numpy is not installed')
+	def progress(case):
+		sys.stderr.write('{suite:10} {tuning:24} p50 {p50:9.3f} p99 {p99:9.3f} ms  count {count}\n'.format(**case))
+	results = run(suites,args.quick,args.tunings,args.engine,args.config,progress)
+	text = json.dumps(results,indent=1)
+	if args.output:
+		with open(args.output,'w') as fh:
+			fh.write(text)
+	else:
+		print(text)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,29 @@
+''' ccengine.capos
+
+The fret each string starts from once capos are applied.  Capos are a dict of
+fret -> string mask (a list of booleans, one per string), the 5 string banjo's
+fifth string capo is a mask of length 1.  The masks are sized for 6 strings, the strings
+past the end of a mask (on a 7 or 8 string guitar) are not capoed.
+'''
+
+def capoOffsets(capos,numStrings,is5StringBanjo=False,fret5thStringBanjo=5):
+	''' calculate and return the offsets due to the applied capos, an immutable tuple'''
+	offsets = [0]*numStrings
+	if not is5StringBanjo:
+		for fret in capos.keys():
+			mask = capos[fret]
+			for i in range(numStrings):
+				value = fret if i < len(mask) and mask[i] else 0
+				offsets[i] = max(offsets[i],value)
+	else: # 5 string banjo
+		offsets = [fret5thStringBanjo,0,0,0,0]
+		for fret in capos.keys():
+			mask = capos[fret]
+			if len(mask) == 1:
+			# is the fifth string
+				offsets[0] = max(offsets[0],fret)
+			else:
+				for i in range(1,5):
+					value = fret if mask[i] else 0
+					offsets[i] = max(offsets[i],value)
+	return tuple(offsets)
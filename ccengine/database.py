@@ -0,0 +1,243 @@
+''' ccengine.database
+
+A precomputed fingering database for the whole instrument and chord catalog.
+Every tuning x chord type x 12 roots is searched once, at the tuning's default span and
+neck length with no capos and no search filters, and written to a single file:
+
+	magic 'CCDB', header length (uint32), json header
+	slot table, one (first record, record count) uint32 pair per query
+	fret records, fixed width, one nibble per string (fret+1, 0 is unplayed)
+
+Necks longer than MAX_FRETS don't fit the records, those tunings are left out and
+always searched.
+
+A query's slot is found by arithmetic on its tuning, chord and root numbers, so a
+lookup is constant time, and the file is memory mapped so only the records read are
+paged in.  The header holds a signature of chordcalc_constants.py and config.ini (beside
+chordcalc, wherever it is run from), a database built from other versions of them is stale.
+The app then builds a database for each tuning as it is used (rebuildInBackground with a
+tuning), a few seconds each, rather than the whole catalog.
+
+Build it ahead of time with
+	python -m ccengine.database
+'''
+
+import os, re, json, mmap, struct, hashlib, threading
+from .search import FingeringSearch, ShapeCache
+
+DB_FILE_NAME = 'fingerings.db'
+DB_VERSION = 2
+DB_MAGIC = b'CCDB'
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # chordcalc and its catalog
+DB_SOURCES = [os.path.join(APP_DIR,name) for name in ('chordcalc_constants.py', 'config.ini')]
+SLOT = struct.Struct('<II')
+MAX_FRETS = 14   # fret+1 in a nibble
+
+def sourceSignature(sources=DB_SOURCES):
+	''' hash of the files the catalog is built from'''
+	digest = hashlib.sha1(str(DB_VERSION).encode())
+	for source in sources:
+		if os.path.exists(source):
+			with open(source,'rb') as fh:
+				digest.update(fh.read())
+	return digest.hexdigest()
+
+def is5StringBanjo(title,notes):
+	''' same test as Model.changeInstrument'''
+	return bool(re.match('banjo',title,flags=re.I)) and len(notes) == 5
+
+def tuningKey(notes,banjo):
+	return '{}{}'.format(','.join([str(note) for note in notes]),'b' if banjo else '')
+
+def tuningPath(path,notes,banjo):
+	''' the database of one tuning, beside the catalog database at path'''
+	name,ext = os.path.splitext(path)
+	return '{}-{}{}'.format(name,hashlib.sha1(tuningKey(notes,banjo).encode()).hexdigest()[:12],ext)
+
+def chordKey(chordTones):
+	return ','.join([str(tone) for tone in chordTones])
+
+def packFrets(frets,width):
+	''' frets as width bytes, two strings per byte'''
+	nibbles = [fret+1 for fret in frets] + [0]*(2*width - len(frets))
+	return bytes(bytearray([nibbles[i] | (nibbles[i+1] << 4) for i in range(0,2*width,2)]))
+
+def unpackFrets(record,numStrings):
+	frets = []
+	for byte in bytearray(record):
+		frets.append((byte & 0xf) - 1)
+		frets.append((byte >> 4) - 1)
+	return frets[:numStrings]
+
+
+def build(path,tunings,chords,numFrets=14,fret5thStringBanjo=5,signature=None):
+	''' search the catalog and write the database.  tunings and chords are the
+	TUNING_LIST_CLEAN and CHORD_LIST_CLEAN entries, numFrets is the neck length
+	of tunings that don't give one'''
+	tuningKeys = []
+	spans = []
+	frets = []
+	queries = []
+	seen = set()
+	for tuning in tunings:
+		banjo = is5StringBanjo(tuning['title'],tuning['notes'])
+		key = tuningKey(tuning['notes'],banjo)
+		if key in seen: # the first entry wins, as it would in the instrument table
+			continue
+		seen.add(key)
+		tuningFrets = tuning.get('frets',numFrets)
+		if tuningFrets > MAX_FRETS:
+			continue
+		tuningKeys.append(key)
+		spans.append(tuning['span'])
+		frets.append(tuningFrets)
+		queries.append((tuning['notes'],tuning['span'],banjo,tuningFrets))
+	chordKeys = []
+	chordTones = []
+	for chord in chords:
+		key = chordKey(chord['fingering'])
+		if key not in chordKeys:
+			chordKeys.append(key)
+			chordTones.append(chord['fingering'])
+	width = (max([len(query[0]) for query in queries]) + 1)//2
+	header = {'version':DB_VERSION,
+				'signature':signature or sourceSignature(),
+				'recordWidth':width,
+				'tunings':tuningKeys,
+				'spans':spans,
+				'frets':frets,
+				'chords':chordKeys}
+	headerBytes = json.dumps(header).encode()
+	slots = []
+	numRecords = 0
+	shapes = ShapeCache(1) # the roots of one chord type are built together
+	tmpPath = path + '.tmp'
+	with open(tmpPath,'wb') as fh:
+		fh.write(DB_MAGIC)
+		fh.write(struct.pack('<I',len(headerBytes)))
+		fh.write(headerBytes)
+		slotBase = fh.tell()
+		fh.write(b'\0'*SLOT.size*len(queries)*len(chordTones)*12) # filled in below
+		for notes,span,banjo,tuningFrets in queries:
+			for tones in chordTones:
+				search = FingeringSearch(notes,0,tones,span,is5StringBanjo=banjo,
+								fret5thStringBanjo=fret5thStringBanjo,numFrets=tuningFrets,shapes=shapes)
+				for root in range(12):
+					records = [packFrets(frets,width) for frets in search.withChord(root,tones).fingerings()]
+					fh.write(b''.join(records))
+					slots.append(SLOT.pack(numRecords,len(records)))
+					numRecords += len(records)
+		fh.seek(slotBase)
+		fh.write(b''.join(slots))
+	os.replace(tmpPath,path)
+	
+	
+class FingeringDB(object):
+	''' read only, memory mapped view of a fingering database'''
+	def __init__(self,path):
+		self._fh = open(path,'rb')
+		self._map = mmap.mmap(self._fh.fileno(),0,access=mmap.ACCESS_READ)
+		if self._map[:4] != DB_MAGIC:
+			raise ValueError('not a fingering database')
+		headerLength, = struct.unpack('<I',self._map[4:8])
+		header = json.loads(self._map[8:8+headerLength].decode())
+		self.version = header.get('version')
+		if self.version != DB_VERSION: # older layouts lack keys read below, they are stale
+			self.close()
+			raise ValueError('fingering database version {}, expected {}'.format(self.version,DB_VERSION))
+		self.signature = header['signature']
+		self._width = header['recordWidth']
+		self._tunings = dict((key,i) for i,key in enumerate(header['tunings']))
+		self._spans = header['spans']
+		self._frets = header['frets']
+		self._chords = dict((key,i) for i,key in enumerate(header['chords']))
+		self._slotBase = 8 + headerLength
+		self._recordBase = self._slotBase + SLOT.size*len(self._tunings)*len(self._chords)*12
+
+	def close(self):
+		self._map.close()
+		self._fh.close()
+
+	def isCurrent(self,signature=None):
+		return self.version == DB_VERSION and self.signature == (signature or sourceSignature())
+
+	def lookup(self,tuning,banjo,root,chordTones,span,numFrets):
+		''' the fingerings (lists of frets) for the query, or None if it isn't in the database'''
+		t = self._tunings.get(tuningKey(tuning,banjo))
+		c = self._chords.get(chordKey(chordTones))
+		if t is None or c is None or root is None or span != self._spans[t]:
+			return None
+		if numFrets != self._frets[t]:
+			return None
+		slot = self._slotBase + SLOT.size*((t*len(self._chords) + c)*12 + root)
+		first,count = SLOT.unpack(self._map[slot:slot+SLOT.size])
+		return self.records(first,count,len(tuning))
+
+	def records(self,first,count,numStrings):
+		start = self._recordBase + first*self._width
+		for i in range(count):
+			offset = start + i*self._width
+			yield unpackFrets(self._map[offset:offset+self._width],numStrings)
+
+
+def catalog(configFileName=None):
+	''' the tunings and chords, from the config file (the app's config.ini) if there is one'''
+	configFileName = configFileName or DB_SOURCES[1]
+	if os.path.exists(configFileName):
+		with open(configFileName,'r') as fh:
+			config = json.load(fh)
+		return config['TUNING_LIST_CLEAN'],config['CHORD_LIST_CLEAN']
+	import chordcalc_constants
+	return chordcalc_constants.TUNING_LIST_CLEAN,chordcalc_constants.CHORD_LIST_CLEAN
+
+def openCurrent(path=DB_FILE_NAME):
+	''' the database at path, or None if it is missing or stale'''
+	if not os.path.exists(path):
+		return None
+	try:
+		db = FingeringDB(path)
+	except (ValueError,KeyError,OSError):
+		return None
+	if not db.isCurrent():
+		db.close()
+		return None
+	return db
+
+_rebuilding = []
+
+def rebuildInBackground(path=DB_FILE_NAME,done=None,tuning=None):
+	''' rebuild a missing or stale database on a worker thread, then call done().  If
+	tuning (notes, is 5 string banjo) is given only its database is built, at tuningPath.
+	Returns False, with nothing to build, if the tuning isn't in the catalog or its neck 
+	is too long, or a build is already running.  The build reads only the catalog, so it 
+	can run while the app is in use'''
+	if _rebuilding:
+		return False
+	tunings,chords = catalog()
+	if tuning is not None:
+		key = tuningKey(*tuning)
+		tunings = [entry for entry in tunings if entry.get('frets',MAX_FRETS) <= MAX_FRETS and
+					tuningKey(entry['notes'],is5StringBanjo(entry['title'],entry['notes'])) == key][:1]
+		if not tunings:
+			return False
+		path = tuningPath(path,*tuning)
+	def run():
+		try:
+			build(path,tunings,chords)
+		finally:
+			del _rebuilding[:]
+		if done:
+			done()
+	worker = threading.Thread(target=run)
+	worker.daemon = True
+	_rebuilding.append(worker)
+	worker.start()
+	return True
+
+
+if __name__ == '__main__':
+	import time
+	start = time.time()
+	tunings,chords = catalog()
+	build(DB_FILE_NAME,tunings,chords)
+	print('built {} ({} bytes) in {:.1f}s'.format(DB_FILE_NAME,os.path.getsize(DB_FILE_NAME),time.time()-start))
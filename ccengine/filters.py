@@ -0,0 +1,194 @@
+''' ccengine.filters
+
+Filters that narrow the fingerings of a chord, and their ranking by playability.
+'''
+
+import heapq
+from .fingering import LazySequence
+
+# Filters narrow (or for DOUBLE_STOPS, split up) the fingerings found for a chord.  Each
+# fingering is a Fingering record (see ccengine.fingering).  The active filters are compiled
+# once into an ordered chain of steps that the fingerings stream through in a single pass:
+#    'filter' steps are predicates, run most selective first
+#    'map' steps return a (possibly altered) copy of the fingering, or None to drop it
+#    'expand' steps return a list of fingerings made from one
+# Narrowing filters commute with each other, but not with the steps that alter the chord
+# tones, so those keep their place in the chain.
+
+FILTER_NARROW_ORDER = ['NO_DEAD', 'HIGH_4', 'LOW_4', 'FULL_CHORD', 'NO_OPEN']
+FILTER_ALTER_ORDER = ['HIGH_3', 'LOW_3', 'DOUBLE_STOPS']
+FILTER_AFTER_ORDER = ['NO_WIDOW']
+_compiledFilters = {}
+
+def filterFullChord(fingering): # must have at least R,3 and 5 triad
+	return len(set(fingering.tones).intersection(['R','b3','3','#5','5'])) == 3
+	
+def filterNoDead(fingering): #remove all with dead notes
+	return -1 not in fingering.degrees
+	
+def filterNoOpen(fingering):
+	for i in range(len(fingering.frets)):
+		if fingering.isOpen(i):
+			return False
+	return True
+	
+def stringsDeadOnly(deadStrings):
+	''' return a filter where only the deadStrings are unplayed'''
+	def filterDeadOnly(fingering):
+		for i in range(len(fingering.frets)):
+			if (i in deadStrings) != fingering.isDead(i):
+				return False
+		return True
+	return filterDeadOnly
+	
+def dropString(deadString):
+	''' return a map for the mandolin three string filters.  deadString must be unplayed,
+	unless it is the root or 5th, in which case it is dropped'''
+	def mapDropString(fingering):
+		tones = fingering.tones
+		for i in range(len(fingering.frets)):
+			if i == deadString:
+				if not fingering.isDead(i):
+					if tones[i] in ['R','#5','5']: # for mandolin, allow for root or 5th to be abandoned
+						return fingering.withDead([i])
+					return None
+			elif fingering.isDead(i):
+				return None
+		return fingering
+	return mapDropString
+	
+def doubleStops(numStrings):
+	''' return an expansion into the adjacent string double stops of the chord'''
+	def expandDoubleStops(fingering):
+		stops = []
+		tones = fingering.tones
+		for i,string in enumerate(tones):
+			if i+1 == numStrings:
+				break
+			nextString = tones[i+1]
+			if string == 'X' or nextString == 'X' or string == nextString: 
+				continue
+			#rebuild the fingering as a double stop for this pair
+			others = [j for j in range(numStrings) if j < i or j > i+1]
+			stops.append(fingering.withDead(others,unfret=True))
+		return stops
+	return expandDoubleStops
+	
+def noWidow(numStrings):
+	''' return a filter that removes isolated dead strings (but not first or last)'''
+	def filterNoWidow(fingering):
+		for i in range(numStrings):
+			if fingering.isDead(i) and not (i == 0 or i == numStrings-1):
+				return False
+		return True
+	return filterNoWidow
+
+def filterStep(step,stream):
+	for fingering in stream:
+		if step(fingering):
+			yield fingering
+			
+def mapStep(step,stream):
+	for fingering in stream:
+		result = step(fingering)
+		if result is not None:
+			yield result
+			
+def expandStep(step,stream):
+	for fingering in stream:
+		for result in step(fingering):
+			yield result
+			
+FILTER_STEP_KINDS = {'filter':filterStep, 'map':mapStep, 'expand':expandStep}
+
+def compile_filters(filters,instrumentType,numStrings):
+	''' return the ordered (kind, function) steps for the filters '''
+	key = (tuple(sorted(filters)),instrumentType,numStrings)
+	if key in _compiledFilters:
+		return _compiledFilters[key]
+	steps = {
+			'FULL_CHORD':	('filter',filterFullChord),
+			'NO_DEAD':		('filter',filterNoDead),
+			'NO_OPEN':		('filter',filterNoOpen),
+			'HIGH_4':			('filter',stringsDeadOnly([0,1])),
+			'LOW_4':			('filter',stringsDeadOnly([4,5])),
+			'HIGH_3':			('map',dropString(0)),
+			'LOW_3':			('map',dropString(3)),
+			'NO_WIDOW':		('filter',noWidow(numStrings)),
+			}
+	if instrumentType == 'mando': # create adjacent string double stops for the chords
+		steps['DOUBLE_STOPS'] = ('expand',doubleStops(numStrings))
+	order = FILTER_NARROW_ORDER + FILTER_ALTER_ORDER + FILTER_AFTER_ORDER
+	compiled = [steps[name] for name in order if name in filters and name in steps]
+	_compiledFilters[key] = compiled
+	return compiled
+	
+def apply_filters(filters,fingerings,instrumentType):
+	''' for the fingerings and filters, return only those chords that apply'''
+	if not filters:
+		return fingerings
+	return NarrowedSequence(filters,instrumentType,fingerings)
+	
+class NarrowedSequence(LazySequence):
+	''' the fingerings that pass the filters, unique, as a LazySequence over the unfiltered
+	ones.  Each unfiltered fingering goes through the compiled steps when it is reached, 
+	so advance(count) is a bounded step, at most count more of them are searched for'''
+	def __init__(self,filters,instrumentType,fingerings):
+		LazySequence.__init__(self,())
+		self.filters = filters
+		self.instrumentType = instrumentType
+		if not isinstance(fingerings,LazySequence):
+			fingerings = LazySequence(fingerings)
+		self.fingerings = fingerings
+		self.read = 0    # unfiltered fingerings narrowed so far
+		self.seen = set()
+		self.steps = None
+		
+	def fill(self,count=None):
+		while not self.complete and (count is None or len(self._items) < count):
+			self.narrowNext()
+			
+	def advance(self,count):
+		''' narrow count more of the unfiltered fingerings'''
+		for i in range(count):
+			if self.complete:
+				return
+			self.narrowNext()
+			
+	def narrowNext(self):
+		if not self.fingerings.has(self.read):
+			self.complete = True
+			return
+		fingering = self.fingerings[self.read]
+		self.read += 1
+		if self.steps is None:
+			self.steps = compile_filters(self.filters,self.instrumentType,len(fingering.frets))
+		stream = [fingering]
+		for kind,step in self.steps:
+			stream = FILTER_STEP_KINDS[kind](step,stream)
+		for result in stream:
+			if result.key not in self.seen:
+				self.seen.add(result.key)
+				self._items.append(result)
+	
+	
+# Playability, lower scores are easier to play.  Wide stretches cost the most, then
+# each fretted note and each dead string, and a little for every fret up the neck
+
+PLAYABILITY_WEIGHTS = {'spread':3, 'fretted':2, 'dead':2, 'position':1}
+
+def playabilityScore(fingering):
+	fretted = [fret for fret in fingering.frets if fret > 0]
+	spread = max(fretted) - min(fretted) if fretted else 0
+	dead = sum([1 for degree in fingering.degrees if degree == -1])
+	position = min(fretted) if fretted else 0
+	weights = PLAYABILITY_WEIGHTS
+	return (weights['spread']*spread + weights['fretted']*len(fretted) + 
+			weights['dead']*dead + weights['position']*position)
+	
+def rankFingerings(fingerings,limit):
+	''' the limit most playable fingerings, best first.  Keeps a heap of limit items
+	instead of sorting them all, ties stay in the order they were found'''
+	ranked = LazySequence(heapq.nsmallest(limit,fingerings,key=playabilityScore))
+	ranked.fill()
+	return ranked
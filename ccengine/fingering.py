@@ -0,0 +1,152 @@
+''' ccengine.fingering
+
+Fingering records and the containers the engine hands them back in.
+'''
+
+from array import array
+from collections import OrderedDict
+
+def fingeringKey(frets):
+	''' pack a fingering (frets -1..30) into an int for hashing'''
+	key = 1
+	for fret in frets:
+		key = (key << 5) | (fret + 1)
+	return key
+	
+class Fingering(object):
+	''' one chord fingering.  frets (-1 unplayed) and the chord degree on each string
+	(an index into names, -1 for a dead string) are held as small int arrays.  A string 
+	can be dead but still have a fret, when a filter drops it from the chord.  The hash 
+	is packed from the frets once.  Pure musical data, the view works out where to draw it'''
+	__slots__ = ('frets','degrees','names','key')
+	
+	def __init__(self, frets, degrees, names):
+		self.frets = array('b', frets)
+		self.degrees = array('b', degrees)
+		self.names = names
+		self.key = fingeringKey(self.frets)
+		
+	@property
+	def tones(self):
+		''' the chord tone name on each string, X for a dead string '''
+		return [self.names[degree] if degree != -1 else 'X' for degree in self.degrees]
+		
+	def isDead(self, string):
+		return self.degrees[string] == -1
+		
+	def isOpen(self, string):
+		return self.frets[string] == 0 and self.degrees[string] != -1
+		
+	def withDead(self, strings, unfret=False):
+		''' a copy with strings dead (and unplayed if unfret) '''
+		frets = array('b', self.frets)
+		degrees = array('b', self.degrees)
+		for string in strings:
+			degrees[string] = -1
+			if unfret:
+				frets[string] = -1
+		return Fingering(frets, degrees, self.names)
+		
+	def __hash__(self):
+		return self.key
+		
+	def __eq__(self, other):
+		return isinstance(other, Fingering) and self.frets == other.frets and self.degrees == other.degrees
+		
+	def __ne__(self, other):
+		return not self == other
+		
+	def __repr__(self):
+		return 'Fingering({}, {})'.format(list(self.frets), self.tones)
+		
+class LRUCache(object):
+	''' bounded least recently used cache with hit/miss counters '''
+	def __init__(self, maxsize=64):
+		self.maxsize = maxsize
+		self.hits = 0
+		self.misses = 0
+		self._items = OrderedDict()
+		
+	def __len__(self):
+		return len(self._items)
+		
+	def __contains__(self, key):
+		return key in self._items
+		
+	def get(self, key, default=None):
+		''' return the cached value (and mark it as recently used) or default '''
+		try:
+			value = self._items.pop(key)
+		except KeyError:
+			self.misses += 1
+			return default
+		self._items[key] = value
+		self.hits += 1
+		return value
+		
+	def put(self, key, value):
+		self._items.pop(key, None)
+		self._items[key] = value
+		while len(self._items) > self.maxsize:
+			self._items.popitem(last=False)
+			
+	def clear(self):
+		self._items.clear()
+		
+class LazySequence(object):
+	''' read only, list like view of an iterable.  Items are only generated as they
+	are asked for and are kept, so the iterable is run at most once'''
+	def __init__(self, iterable):
+		self._items = []
+		self._source = iter(iterable)
+		self.complete = False
+		
+	def fill(self, count=None):
+		''' generate until there are count items (all of them if count is None) '''
+		while not self.complete and (count is None or len(self._items) < count):
+			try:
+				self._items.append(next(self._source))
+			except StopIteration:
+				self.complete = True
+				self._source = None
+				
+	def advance(self, count):
+		''' generate count more items, a bounded step of a computation '''
+		self.fill(len(self._items) + count)
+		
+	@property
+	def found(self):
+		''' the number of items generated so far '''
+		return len(self._items)
+		
+	def has(self, index):
+		''' is there an item at index (generating up to it if needed) '''
+		self.fill(index + 1)
+		return 0 <= index < len(self._items)
+		
+	def clamp(self, index):
+		''' index limited to the last item, generating no further than index '''
+		self.fill(index + 1)
+		return max(0, min(index, len(self._items) - 1))
+		
+	def __getitem__(self, index):
+		if isinstance(index, slice) or index < 0:
+			self.fill()
+		else:
+			self.fill(index + 1)
+		return self._items[index]
+		
+	def __iter__(self):
+		index = 0
+		while self.has(index):
+			yield self._items[index]
+			index += 1
+			
+	def __len__(self):
+		self.fill()
+		return len(self._items)
+		
+	def __bool__(self):
+		return self.has(0)
+		
+	__nonzero__ = __bool__
@@ -0,0 +1,285 @@
+''' ccengine.midi
+
+Chord recognition over Standard MIDI files, a chord timeline per file as JSON or CSV.
+
+	python -m ccengine.midi song.mid [more.mid ...] [-o timeline.json] [--csv] [--window 0.05]
+
+Files are streamed, never read whole.  The track chunks are located by seeking past
+them, then each track is read in small buffered chunks through its own file handle and
+the tracks are merged in time order, so memory is bounded by the number of tracks and
+the notes held, not the length of the file.
+
+Note-ons within --window seconds of the first of a group are one window.  A window's
+notes are those struck in it plus those still held when it closes, named with the
+identify mode chord table (config.ini, else chordcalc_constants) over the lowest of them,
+or the best ranked chord if identify finds nothing.  Names are looked up once per
+(bass, pitch class set) so a catalog of files costs little more than parsing them.
+Consecutive windows with the same name are one entry of the timeline.
+'''
+
+import sys, csv, json, heapq, struct, argparse
+import chordcalc_constants
+from .theory import pitchClassSet, ChordIndex
+from .database import catalog
+
+CHUNK_SIZE = 16384
+WINDOW = 0.05               # seconds, note-ons this close together are one chord
+DEFAULT_TEMPO = 500000      # microseconds per quarter note, 120 bpm
+DRUM_CHANNEL = 9            # general MIDI percussion, no pitches
+CSV_FIELDS = ['file', 'start', 'end', 'chord', 'root', 'bass', 'ranked', 'notes']
+
+# event kinds, in the order they are applied at the same tick
+TEMPO, NOTE_OFF, NOTE_ON = 0, 1, 2
+
+# data bytes of the channel messages, by status high nibble
+DATA_BYTES = {0x80:2, 0x90:2, 0xa0:2, 0xb0:2, 0xc0:1, 0xd0:1, 0xe0:2}
+
+class ChunkReader(object):
+	''' bytes from length bytes of an open file, read CHUNK_SIZE at a time'''
+	def __init__(self,fh,length,chunkSize=CHUNK_SIZE):
+		self.fh = fh
+		self.remaining = length
+		self.chunkSize = chunkSize
+		self.buffer = b''
+		self.pos = 0
+
+	def more(self):
+		return self.pos < len(self.buffer) or self.remaining > 0
+
+	def fill(self):
+		if self.remaining <= 0:
+			raise ValueError('track ends inside an event')
+		self.buffer = bytearray(self.fh.read(min(self.chunkSize,self.remaining)))
+		if not self.buffer:
+			raise ValueError('file ends inside a track')
+		self.remaining -= len(self.buffer)
+		self.pos = 0
+
+	def byte(self):
+		if self.pos == len(self.buffer):
+			self.fill()
+		value = self.buffer[self.pos]
+		self.pos += 1
+		return value
+
+	def skip(self,count):
+		while count > 0:
+			if self.pos == len(self.buffer):
+				self.fill()
+			step = min(count,len(self.buffer) - self.pos)
+			self.pos += step
+			count -= step
+
+	def read(self,count):
+		return bytes([self.byte() for i in range(count)])
+
+	def varlen(self):
+		''' a variable length quantity, 7 bits a byte, most significant first'''
+		value = 0
+		while True:
+			byte = self.byte()
+			value = (value << 7) | (byte & 0x7f)
+			if not byte & 0x80:
+				return value
+
+
+class MidiFile(object):
+	''' the header and track chunk locations of a Standard MIDI file'''
+	def __init__(self,path):
+		self.path = path
+		self.tracks = [] # (offset, length) of each MTrk chunk
+		with open(path,'rb') as fh:
+			header = self.chunkHeader(fh)
+			if header is None or header[0] != b'MThd' or header[1] < 6:
+				raise ValueError('{} is not a MIDI file'.format(path))
+			self.format,numTracks,self.division = struct.unpack('>HHH',fh.read(6))
+			fh.seek(header[1] - 6,1)
+			while len(self.tracks) < numTracks:
+				header = self.chunkHeader(fh)
+				if header is None:
+					break
+				kind,length = header
+				if kind == b'MTrk':
+					self.tracks.append((fh.tell(),length))
+				fh.seek(length,1)
+
+	def chunkHeader(self,fh):
+		header = fh.read(8)
+		if len(header) < 8:
+			return None
+		return struct.unpack('>4sI',header)
+
+	def secondsPerTick(self,tempo):
+		''' for the division, ticks per quarter note or SMPTE frames and ticks per frame'''
+		if self.division & 0x8000:
+			fps = 256 - (self.division >> 8)
+			return 1.0/(fps*(self.division & 0xff))
+		return tempo/(1000000.0*self.division)
+
+	def trackEvents(self,track):
+		''' (tick, kind, track, channel, data) for the tempo and note events of a track'''
+		offset,length = self.tracks[track]
+		with open(self.path,'rb') as fh:
+			fh.seek(offset)
+			reader = ChunkReader(fh,length)
+			tick = 0
+			status = 0
+			while reader.more():
+				tick += reader.varlen()
+				byte = reader.byte()
+				if byte == 0xff: # meta
+					meta = reader.byte()
+					size = reader.varlen()
+					if meta == 0x51 and size == 3:
+						data = reader.read(3)
+						yield (tick,TEMPO,track,0,(data[0] << 16) | (data[1] << 8) | data[2])
+					else:
+						reader.skip(size)
+					if meta == 0x2f: # end of track
+						return
+					status = 0 # meta and sysex events cancel running status
+					continue
+				if byte in (0xf0,0xf7): # sysex
+					reader.skip(reader.varlen())
+					status = 0
+					continue
+				if byte & 0x80:
+					status = byte
+					first = reader.byte()
+				elif status:
+					first = byte # running status
+				else:
+					raise ValueError('data byte without a status in track {}'.format(track))
+				kind = status & 0xf0
+				second = reader.byte() if DATA_BYTES.get(kind,0) == 2 else 0
+				if kind == 0x90 and second:
+					yield (tick,NOTE_ON,track,status & 0x0f,first)
+				elif kind == 0x80 or kind == 0x90:
+					yield (tick,NOTE_OFF,track,status & 0x0f,first)
+
+	def events(self):
+		''' (seconds, kind, channel, note) for the note events of every track in time order'''
+		merged = heapq.merge(*[self.trackEvents(track) for track in range(len(self.tracks))])
+		lastTick = 0
+		seconds = 0.0
+		perTick = self.secondsPerTick(DEFAULT_TEMPO)
+		for tick,kind,track,channel,data in merged:
+			seconds += (tick - lastTick)*perTick
+			lastTick = tick
+			if kind == TEMPO:
+				perTick = self.secondsPerTick(data)
+			else:
+				yield seconds,kind,channel,data
+
+
+class ChordNamer(object):
+	''' names for (bass, pitch class set), from a ChordIndex, each looked up once'''
+	def __init__(self,chordTypes,noteNames):
+		self.index = ChordIndex([(chord['title'],chord['fingering']) for chord in chordTypes])
+		self.noteNames = noteNames
+		self.names = {}
+
+	def name(self,notes):
+		''' {chord, root, bass, ranked, notes} for the notes, named over the lowest'''
+		return self.namePitchClasses(pitchClassSet(notes),min(notes) % 12)
+
+	def namePitchClasses(self,pcs,bass=None):
+		''' the same for a pitch class set, over the bass pitch class if it is known'''
+		if (bass,pcs) not in self.names:
+			notes = [pc for pc in range(12) if (pcs >> pc) & 1]
+			chords = [chord for chord in self.index.identify(notes,self.noteNames,bass) if chord['root'] != -1]
+			ranked = not chords
+			if ranked:
+				chords = self.index.rank(notes,self.noteNames,1)
+			self.names[(bass,pcs)] = {'chord':chords[0]['title'] if chords else '',
+							'root':self.noteNames[chords[0]['root']] if chords else '',
+							'bass':self.noteNames[bass] if bass is not None else '',
+							'ranked':ranked,
+							'notes':' '.join([self.noteNames[pc] for pc in notes])}
+		return self.names[(bass,pcs)]
+
+
+def noteWindows(events,window=WINDOW,drums=False):
+	''' (start, notes) for each window of note-ons, the notes struck in it and those still
+	held when it closes, then (end, None)'''
+	held = {}     # (channel, note) -> number of note-ons not yet off
+	struck = None # the notes of the open window
+	start = seconds = 0.0
+	for seconds,kind,channel,note in events:
+		if struck and seconds > start + window:
+			yield start,struck.union([pitch for part,pitch in held])
+			struck = None
+		if channel == DRUM_CHANNEL and not drums:
+			continue
+		key = (channel,note)
+		if kind == NOTE_ON:
+			if not struck:
+				struck = set()
+				start = seconds
+			struck.add(note)
+			held[key] = held.get(key,0) + 1
+		elif key in held:
+			held[key] -= 1
+			if not held[key]:
+				del held[key]
+	if struck:
+		yield start,struck.union([pitch for part,pitch in held])
+	yield seconds,None
+
+def chordTimeline(path,namer,window=WINDOW,drums=False):
+	''' the timeline entries {file, start, end, chord, ...} of a MIDI file, as each is completed'''
+	current = None
+	for seconds,notes in noteWindows(MidiFile(path).events(),window,drums):
+		name = namer.name(notes) if notes else None
+		if current and name and name['chord'] == current['chord']:
+			continue
+		if current:
+			current['end'] = round(seconds,4)
+			yield current
+		if name:
+			current = {'file':path, 'start':round(seconds,4), 'end':None}
+			current.update(name)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='name the chords of MIDI files')
+	parser.add_argument('files',nargs='+',help='Standard MIDI files')
+	parser.add_argument('-o','--output',help='write the timeline here instead of to stdout')
+	parser.add_argument('--csv',action='store_true',help='CSV rows instead of JSON')
+	parser.add_argument('--window',type=float,default=WINDOW,help='seconds of note-ons that are one chord')
+	parser.add_argument('--drums',action='store_true',help='include the percussion channel')
+	args = parser.parse_args(argv)
+	tunings,chords = catalog()
+	namer = ChordNamer(chords,chordcalc_constants.NOTE_NAMES)
+	writeTimelines(args.files,lambda path: chordTimeline(path,namer,args.window,args.drums),
+					args.output,args.csv)
+
+def writeTimelines(paths,timeline,output=None,asCsv=False):
+	''' write timeline(path) for each path as CSV rows or a JSON list of {file, chords},
+	a file that can't be read is reported and written as {file, error}'''
+	out = open(output,'w',newline='') if output else sys.stdout
+	try:
+		if asCsv:
+			writer = csv.DictWriter(out,CSV_FIELDS)
+			writer.writeheader()
+		else:
+			out.write('[')
+		for number,path in enumerate(paths):
+			try:
+				entries = list(timeline(path))
+			except (ValueError,OSError,EOFError,struct.error) as e:
+				sys.stderr.write('{}: {}\n'.format(path,e))
+				entries = None
+			if asCsv:
+				writer.writerows(entries or [])
+			else:
+				result = {'file':path, 'chords':entries} if entries is not None else {'file':path, 'error':True}
+				out.write(('' if number == 0 else ',') + '\n' + json.dumps(result))
+		if not asCsv:
+			out.write('\n]\n')
+	finally:
+		if output:
+			out.close()
+
+if __name__ == '__main__':
+	main()
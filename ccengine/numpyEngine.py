@@ -0,0 +1,63 @@
+''' ccengine.numpyEngine
+
+Vectorized candidate generation and validation for the chord calculator.
+All of the candidate fingerings for a position are held as one int8 array
+(candidates x strings), with -1 for an unplayed string.  Pitch classes are
+computed against the tuning vector in a single broadcast and chord coverage
+is checked with a bitwise reduction across the strings.
+
+numpy is optional, if it isn't installed, available is False and the
+Model stays on the pure python search.  It is imported on first use, so the
+engine imports quickly when the numpy backend isn't used.
+'''
+
+import importlib.util
+
+available = importlib.util.find_spec('numpy') is not None
+np = None
+
+def loadNumpy():
+	''' numpy, imported the first time it is needed'''
+	global np
+	if np is None:
+		import numpy
+		np = numpy
+	return np
+	
+def candidateArray(validfrets):
+	''' all combinations of the valid frets (plus unplayed) as an int8 array, 
+	one row per candidate in the same order as the python search'''
+	loadNumpy()
+	options = [np.array(frets + [-1], dtype=np.int8) for frets in validfrets]
+	grids = np.meshgrid(*options, indexing='ij')
+	return np.stack([grid.ravel() for grid in grids], axis=1)
+	
+def presentPitchClasses(candidates, tuning):
+	''' pitch class set sounded by each candidate '''
+	loadNumpy()
+	numStrings = candidates.shape[1]
+	openStrings = np.asarray(tuning[:numStrings], dtype=np.int16)
+	pcs = (openStrings + candidates.astype(np.int16)) % 12 # broadcast over candidates
+	bits = np.where(candidates >= 0, np.left_shift(1, pcs), 0)
+	return np.bitwise_or.reduce(bits, axis=1)
+	
+def usesNewFret(candidates, newfrets):
+	''' does each candidate use at least one of the per string newfrets '''
+	loadNumpy()
+	isNew = np.zeros(candidates.shape[0], dtype=bool)
+	for i, frets in enumerate(newfrets):
+		if frets:
+			isNew |= np.isin(candidates[:, i], frets)
+	return isNew
+	
+def findCandidates(validfrets, tuning, requiredMask, newfrets=None):
+	''' return the fingerings (as lists) that sound every pitch class in requiredMask
+	and, if newfrets is given, use at least one of them'''
+	if not validfrets:
+		return None
+	candidates = candidateArray(validfrets)
+	present = presentPitchClasses(candidates, tuning)
+	valid = (present & requiredMask) == requiredMask
+	if newfrets is not None:
+		valid &= usesNewFret(candidates, newfrets)
+	return candidates[valid].tolist()
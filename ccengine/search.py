@@ -0,0 +1,445 @@
+''' ccengine.search
+
+The fingering search for a single chord query.  A FingeringSearch is a snapshot of
+the Model query state and holds only plain python data, so it can be pickled and run
+in another process.  No ui imports here, the worker processes import this module.
+
+parallelFingerings spreads the window positions of a search across a process pool with
+concurrent.futures.  Results are merged in the same order as the serial search.
+'''
+
+import copy
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+import chordcalc_constants
+from .fingering import fingeringKey, LRUCache
+from .theory import pitchClassSet, inPitchClassSet
+
+class FingeringSearch(object):
+	''' the fingering search for one query.  Takes a snapshot of the Model query state, so
+	a search can be resumed lazily (or elsewhere) after the Model has moved on'''
+	# chord relative notes that the NOxxx_OK filters allow to be missing
+	OPTIONAL_CHORD_NOTES = {'NOROOT_OK':[0], 'NO3RD_OK':[3,4], 'NO5TH_OK':[7]}
+	
+	def __init__(self,tuning,root,chord,span,filters=(),capoOffsets=None,is5StringBanjo=False,
+				fret5thStringBanjo=5,numFrets=14,engine='python',scaleNoteNames=None,shapes=None,
+				maxStrings=6):
+		self.tuning = list(tuning)
+		self.root = root
+		self.chord = tuple(chord)
+		self.span = span
+		self.filters = tuple(filters) if filters else ()
+		self.is5StringBanjo = bool(is5StringBanjo)
+		self.fret5thStringBanjo = fret5thStringBanjo
+		if capoOffsets is None: # no capos, only the banjo 5th string is offset
+			capoOffsets = [0]*len(self.tuning)
+			if self.is5StringBanjo:
+				capoOffsets[0] = fret5thStringBanjo
+		self.capoOffsets = tuple(capoOffsets)
+		self.numFrets = numFrets
+		self.maxStrings = maxStrings # see stringGroup
+		# pitch of each string at fret 0 of the neck.  The 5th string of a banjo only
+		# starts at fret5thStringBanjo, so its neck frets sound that much lower
+		self.pitches = list(self.tuning)
+		if self.is5StringBanjo:
+			self.pitches[0] -= self.fret5thStringBanjo
+		self.engine = engine
+		self.scaleNoteNames = scaleNoteNames or chordcalc_constants.SCALENOTES
+		self.shapes = shapes # a ShapeCache, or None to search every window
+		self._shapeKey = None
+		# candidates examined, the nodes of the depth first search (partial fingerings included)
+		# or the rows of the numpy array.  Closed shapes reused from the ShapeCache are free
+		self.visited = 0
+		self.setChordMasks()
+		
+	@classmethod
+	def fromModel(cls,model,numFrets):
+		''' snapshot the current Model query '''
+		return cls(model._InstrumentTuning,model._RootNoteValue,model._ChordNoteValues,model._Span,
+					filters=model._Filters,
+					capoOffsets=model.capoOffsets(),
+					is5StringBanjo=model._is5StringBanjo,
+					fret5thStringBanjo=model.fretboard_fret5thStringBanjo,
+					numFrets=numFrets,
+					engine=model._Engine,
+					scaleNoteNames=model._ccc['SCALENOTES'],
+					shapes=model._ShapeCache)
+		
+	def fingerings(self):
+		''' generate the fingerings, lowest window first'''
+		# sweep the span window up the neck.  each position only yields the fingerings
+		# that don't fit in any earlier window, so every fingering is found exactly once
+		for position in range(0,self.numFrets-self.span):
+			fingeringThisPosition = self.findFingerings(position)
+			if fingeringThisPosition:
+				for fingering in fingeringThisPosition:
+					yield fingering
+					
+	def findFingerings(self,position):
+		# Get valid frets on the strings
+		
+		validfrets = self.findValidFrets(position)
+		newfrets = self.findNewFrets(position,validfrets)
+		
+		# generate and validate all candidates as one array.  That is every combination of
+		# the valid frets, so extended range instruments stay on the pruned search
+		if self.engine == 'numpy' and self.stringGroup() == len(self.pitches):
+			from . import numpyEngine # imports numpy, only when it's used
+			self.visited += countProduct([len(frets) + 1 for frets in validfrets])
+			return numpyEngine.findCandidates(validfrets,self.pitches,self.requiredMask,newfrets)
+			
+		if position > 0 and self.canUseShapes():
+			return self.findShapeFingerings(position,validfrets,newfrets)
+		
+		# Find all candidates
+		candidates = self.findCandidates(validfrets,newfrets)
+		
+		# Filter out the invalid candidates
+		candidates = self.filterCandidates(candidates)
+		
+		return candidates
+		
+	# Above the nut, a fingering with no open strings is a movable shape: moved up a fret it
+	# is a fingering of the chord a semitone higher.  So the closed fingerings new at window 
+	# position p are the closed fingerings new at position 1, for the root p-1 semitones 
+	# lower, moved up p-1 frets.  Those are kept in the ShapeCache for all 12 roots, and only
+	# the fingerings that use an open string are searched.  Capos and the banjo 5th string
+	# move the nut on some strings, so they always search
+	
+	def canUseShapes(self):
+		return self.shapes is not None and not self.is5StringBanjo and not any(self.capoOffsets)
+		
+	def findShapeFingerings(self,position,validfrets,newfrets):
+		shift = position - 1
+		closed = [[fret + shift if fret != -1 else -1 for fret in shape] 
+					for shape in self.shapes.closedShapes(self,(self.root - shift) % 12)]
+		opened = []
+		if any([self.capoOffsets[i] in frets for i,frets in enumerate(validfrets)]):
+			opened = self.findCandidates(validfrets,newfrets,openOnly=True)
+		# both are in search order, so sorting the two runs together merges them
+		candidates = opened + closed
+		candidates.sort(key=searchOrder)
+		return candidates
+		
+	def findClosedShapes(self):
+		''' the closed fingerings new at position 1'''
+		validfrets = [[fret for fret in frets if fret != 0] for frets in self.findValidFrets(1)]
+		return self.findCandidates(validfrets,self.findNewFrets(1,validfrets)) or []
+		
+	def shapeKey(self):
+		''' everything but the root that the closed shapes depend on'''
+		if self._shapeKey is None:
+			self._shapeKey = (tuple([pitch % 12 for pitch in self.pitches]),self.chord,self.span,
+								tuple(sorted(self.filters)),self.stringGroup())
+		return self._shapeKey
+		
+	# For a given list of starting frets and span, find the ones that are in the chord for that tuning
+	# Returns a list of valid frets for each string
+	# Open strings are included if valid
+	
+	def findValidFrets(self,position):	
+		strings = []
+		nutOffsets = self.capoOffsets
+		for i,string in enumerate(self.pitches):
+			frets = []
+			if nutOffsets[i] <= position:
+				start = position
+				stop = position + self.span+1
+			elif position <= nutOffsets[i] <= position+self.span+1:
+				start = nutOffsets[i]
+				stop = position + self.span+1
+			else: #window is behind the capo, only the open string can be played
+				start = stop = nutOffsets[i]
+			searchrange = [x for x in range(start,stop)]
+			if position != 0 and nutOffsets[i] not in searchrange: # include open strings is not at pos 0
+				searchrange = [nutOffsets[i]] + searchrange
+			for fret in searchrange:
+				if inPitchClassSet(self.chordMask,string + fret):
+					frets.append(fret)
+			strings.append(frets)
+		return strings
+		
+	# For the window at position, find the frets that place a fingering in this window and
+	# in none of the windows below it.  The windows overlap, so a fingering is new at this 
+	# position only if it frets the top fret of the window, or (at position 1) it uses an open
+	# string that position 0 could not reach.  Returns None at position 0 (everything is new)
+	
+	def findNewFrets(self,position,validfrets):
+		if position == 0:
+			return None
+		nutOffsets = self.capoOffsets
+		topFret = position + self.span
+		newfrets = []
+		for i,frets in enumerate(validfrets):
+			if position == 1 and nutOffsets[i] > self.span:
+				newfrets.append([fret for fret in frets if fret in (topFret,nutOffsets[i])])
+			else:
+				newfrets.append([fret for fret in frets if fret == topFret and fret != nutOffsets[i]])
+		return newfrets
+		
+		
+		
+	# Finds all candidate fingerings, given all valid frets
+	# Includes strings that should not be played
+	# Strings are visited low to high, depth first.  A partial fingering is abandoned
+	# as soon as the chord notes it still needs cannot be supplied by the remaining strings,
+	# so only fingerings that would pass isValidChord are generated (in the same order
+	# as the full permutation of the valid frets)
+	# If newfrets is given, a fingering must also use at least one of them (see findNewFrets)
+	# If openOnly, only the fingerings that play an open string are found.  They are searched
+	# once for each choice of the lowest open string, so they are not in search order
+	
+	NEW,OPEN = 1,2  # kinds of fret a fingering can be required to use
+	
+	def findCandidates(self,validfrets,newfrets=None,openOnly=False):
+		if not validfrets:
+			return None
+		NEW,OPEN = self.NEW,self.OPEN
+		mustUse = NEW if newfrets is not None else 0
+		# (fret, chord pitch class sounded, kinds) for each choice on each string, unplayed last
+		choices = []
+		for i,string in enumerate(validfrets):
+			choices.append([(fret,self.chordNotesAt(i,fret),
+							(NEW if newfrets is not None and fret in newfrets[i] else 0) |
+							(OPEN if fret == self.capoOffsets[i] else 0)) 
+							for fret in string + [-1]])
+		if not openOnly:
+			return self.searchChoices(choices,mustUse)
+		candidates = []
+		for lowest in range(len(choices)):
+			opens = [choice for choice in choices[lowest] if choice[2] & OPEN]
+			if not opens:
+				continue
+			split = [[choice for choice in string if not choice[2] & OPEN] for string in choices[:lowest]]
+			candidates += self.searchChoices(split + [opens] + choices[lowest+1:],mustUse)
+		return candidates
+		
+	def searchChoices(self,choices,mustUse):
+		''' depth first search of the choices for each string, see findCandidates'''
+		numStrings = len(choices)
+		group = self.stringGroup()
+		if group < numStrings:
+			return self.searchStringGroups(choices,mustUse,group)
+		# chord pitch classes and kinds of fret that can still be supplied from string i upwards
+		reachable = [0]*(numStrings+1)
+		canUse = [0]*(numStrings+1)
+		for i in range(numStrings-1,-1,-1):
+			reachable[i] = reachable[i+1]
+			canUse[i] = canUse[i+1]
+			for fret,notes,kinds in choices[i]:
+				reachable[i] |= notes
+				canUse[i] |= kinds
+			
+		candidates = []
+		candidate = [None]*numStrings
+		visited = 1 # counted a level at a time, the root here and each node's choices below
+		
+		def search(i,needed,missing):
+			nonlocal visited
+			if needed & ~reachable[i]: # prune, can't complete the chord from here
+				return
+			if missing & ~canUse[i]: # prune, already found in a lower window
+				return
+			if i == numStrings:
+				candidates.append(list(candidate))
+				return
+			visited += len(choices[i])
+			for fret,notes,kinds in choices[i]:
+				candidate[i] = fret
+				search(i+1,needed & ~notes,missing & ~kinds)
+				
+		search(0,self.requiredMask,mustUse)
+		self.visited += visited
+		return candidates
+		
+	def searchStringGroups(self,choices,mustUse,group):
+		''' searchChoices for fingerings played on at most group adjacent strings'''
+		numStrings = len(choices)
+		# chord pitch classes and kinds of fret that strings i up to (not including) j can supply
+		reachable = [[0]*(numStrings+1) for i in range(numStrings+1)]
+		canUse = [[0]*(numStrings+1) for i in range(numStrings+1)]
+		for i in range(numStrings):
+			for j in range(i+1,numStrings+1):
+				reachable[i][j] = reachable[i][j-1]
+				canUse[i][j] = canUse[i][j-1]
+				for fret,notes,kinds in choices[j-1]:
+					reachable[i][j] |= notes
+					canUse[i][j] |= kinds
+		# can strings i upwards all be left unplayed (not if openOnly forced an open string)
+		canRest = [True]*(numStrings+1)
+		for i in range(numStrings-1,-1,-1):
+			canRest[i] = canRest[i+1] and -1 in [fret for fret,notes,kinds in choices[i]]
+			
+		candidates = []
+		candidate = [None]*numStrings
+		visited = 1 # as in searchChoices
+		
+		# end is the string after the last one that may still sound.  It is the top string
+		# until the lowest string is played, then closes to the group of strings above it
+		def search(i,needed,missing,end):
+			nonlocal visited
+			if needed & ~reachable[i][end]: # prune, can't complete the chord from here
+				return
+			if missing & ~canUse[i][end]: # prune, already found in a lower window
+				return
+			if i == end: # the strings above the group are unplayed
+				if canRest[i]:
+					candidates.append(candidate[:i] + [-1]*(numStrings-i))
+				return
+			visited += len(choices[i])
+			for fret,notes,kinds in choices[i]:
+				candidate[i] = fret
+				if fret == -1 or end < numStrings:
+					search(i+1,needed & ~notes,missing & ~kinds,end)
+				else:
+					search(i+1,needed & ~notes,missing & ~kinds,min(numStrings,i+group))
+					
+		search(0,self.requiredMask,mustUse,numStrings)
+		self.visited += visited
+		return candidates
+		
+	def stringGroup(self):
+		''' the most adjacent strings a fingering can span.  On extended range instruments
+		(more than maxStrings strings) a chord is voiced on a group of adjacent strings, 
+		which keeps the search from growing exponentially with the string count'''
+		if self.maxStrings and len(self.pitches) > self.maxStrings:
+			return self.maxStrings
+		return len(self.pitches)
+		
+	def chordNotesAt(self,string,fret):
+		''' return the pitch class set of the chord note sounded by fret on string (-1 is unplayed)'''
+		if fret == -1:
+			return 0
+		return pitchClassSet([self.pitches[string] + fret]) & self.chordMask
+		
+	def setChordMasks(self):
+		''' precompute the pitch class sets for the root, chord and filters'''
+		filterSet = self.filters
+		key = self.root
+		chord = self.chord
+		self.chordMask = pitchClassSet(chord,key)
+		self.chordDegrees = [None]*12
+		for chordrelnote in chord:
+			pc = (key + chordrelnote) % 12
+			if self.chordDegrees[pc] is None:
+				self.chordDegrees[pc] = chordrelnote
+		if 'FULL_CHORD' in filterSet:
+			self.requiredMask = self.chordMask
+			return
+		optional = []
+		for filter in filterSet:
+			optional += self.OPTIONAL_CHORD_NOTES.get(filter,[])
+		self.requiredMask = pitchClassSet([note for note in chord if note not in optional],key)
+		
+		
+		
+	# Tests whether a fingering is valid
+	# Should allow various possibilities - full chord, no 5th, no 3rd, no root, etc
+	
+	def isValidChord(self,candidate):
+		present = 0
+		for i,fret in enumerate(candidate):
+			# ignore unplayed strings
+			if fret != -1:
+				present |= 1 << ((self.pitches[i] + fret) % 12)
+		# do we accept this fingering? all of the required chord notes must be present
+		return not (self.requiredMask & ~present)
+		
+		
+	# Filter out the invalid chords from the list of candidates
+	# Criteria for invalid chords may vary
+	# Returns the list of valid chords
+	
+	def filterCandidates(self,candidates):	
+		if not candidates:
+			return None
+		newlist = []
+		for candidate in candidates:
+			if self.isValidChord(candidate):
+				newlist += [candidate]
+		return newlist
+			
+	def getDegrees(self,fingering):
+		''' the chord degree (index into the scale note names) sounded on each string, -1 if unplayed'''
+		degrees = []
+		for i,fret in enumerate(fingering):
+			if fret == -1:
+				degrees.append(-1)
+			else:
+				degrees.append(self.chordDegrees[(self.pitches[i] + fret) % 12])
+		return degrees
+		
+	def getScaleNotes(self,fingering):
+		return [self.scaleNoteNames[degree] if degree != -1 else 'X' for degree in self.getDegrees(fingering)]
+		
+	def withChord(self,root,chord):
+		''' a copy of this search for another root and chord '''
+		search = copy.copy(self)
+		search.root = root
+		search.chord = tuple(chord)
+		search._shapeKey = None
+		search.visited = 0
+		search.setChordMasks()
+		return search
+		
+		
+def countProduct(sizes):
+	''' the number of combinations of choices of these sizes'''
+	count = 1
+	for size in sizes:
+		count *= size
+	return count
+	
+def searchOrder(fingering):
+	''' sort key giving the order findCandidates generates fingerings in.  As unsigned
+	bytes, unplayed (-1) is 255 and sorts last'''
+	return array('b',fingering).tobytes()
+	
+	
+class ShapeCache(object):
+	''' closed fingerings at position 1, for each chord type and root, shared by 
+	the searches for every root.  It isn't pickled, a worker process starts empty'''
+	def __init__(self,maxsize=32):
+		self._shapes = LRUCache(maxsize)
+		
+	def closedShapes(self,search,root):
+		key = search.shapeKey()
+		table = self._shapes.get(key)
+		if table is None:
+			table = {}
+			self._shapes.put(key,table)
+		if root not in table:
+			table[root] = search.withChord(root,search.chord).findClosedShapes()
+		return table[root]
+		
+	def clear(self):
+		self._shapes.clear()
+		
+	def __getstate__(self):
+		return {'_shapes':LRUCache(self._shapes.maxsize)}
+		
+		
+#--- process pool
+
+def searchPosition(search,position):
+	''' worker: the fingerings new at one window position '''
+	return search.findFingerings(position) or []
+	
+def parallelFingerings(search,executor):
+	''' generate the fingerings for search with each window position running in executor.
+	Positions are yielded in order, so the result matches search.fingerings().  The first
+	fingerings are available as soon as the lowest positions finish'''
+	futures = [executor.submit(searchPosition,search,position) 
+				for position in range(0,search.numFrets-search.span)]
+	seen = set()
+	try:
+		for future in futures:
+			for fingering in future.result():
+				key = fingeringKey(fingering)
+				if key in seen:
+					continue
+				seen.add(key)
+				yield fingering
+	finally: # abandoned part way, don't leave the rest queued
+		for future in futures:
+			future.cancel()
@@ -0,0 +1,360 @@
+''' ccengine.theory
+
+Pitch class sets, scales laid out on the neck and chord identification.
+Notes are semitones, pitch classes are notes mod 12 and chords are lists of
+semitones above the root.
+'''
+
+def pitchClassSet(notes, key=0):
+	''' return the 12 bit pitch class set of notes transposed to key
+	bit n is set if pitch class n is present'''
+	pcs = 0
+	for note in notes:
+		pcs |= 1 << ((key + note) % 12)
+	return pcs
+	
+def inPitchClassSet(pcs, note):
+	''' is the pitch class of note in the pitch class set '''
+	return bool(pcs & (1 << (note % 12)))
+	
+	
+#--- scales
+
+def scaleIntervalSteps(scaleintervals):
+	''' the steps of a scale spelled as S(emitone), T(one) or a number of semitones,
+	with a leading 0 for the root'''
+	intervals = [0]
+	for letter in scaleintervals:
+		if letter == 'S':
+			intervals.append(1)
+		elif letter == 'T':
+			intervals.append(2)
+		else:
+			intervals.append((int(letter)))
+	return intervals
+	
+def scalePitchClasses(key,scaleintervals):
+	''' the pitch classes of the scale on key, root first'''
+	nextNote = key
+	notes = [nextNote]
+	for interval in scaleIntervalSteps(scaleintervals)[1:]:
+		nextNote += interval
+		notes.append(nextNote % 12)
+	return notes
+	
+def scaleOnNeck(tuning,capoOffsets,key,scaleintervals,numFrets):
+	''' the (fret, pitch class) of every scale note on each string, from the nut (or capo)'''
+	notes = scalePitchClasses(key,scaleintervals)
+	scaleNotes= []
+	for i,string in enumerate(tuning):
+		thisString = []
+		for fret in range(capoOffsets[i],numFrets+1):
+			note = (fret + string) % 12
+			if note in notes:
+				thisString.append((fret,note))
+		scaleNotes.append(thisString)
+	return scaleNotes
+	
+def chordScaleOnNeck(tuning,capoOffsets,key,chord,numFrets):
+	''' the (fret-1, chord relative note) of every chord tone on each string'''
+	chordNotes = pitchClassSet(chord,key)
+	scale = []
+	for i,openString in enumerate(tuning):
+		thisString = []
+		for fret in range(capoOffsets[i],numFrets+1): # zero is the open string
+			tone = (openString + fret) %12
+			if inPitchClassSet(chordNotes,tone):
+				thisString.append((fret-1,(tone - key)%12))
+		scale.append(thisString)
+	return scale
+	
+def twoOctaveScale(tuning,scaleNotes,key,scaleintervals,location,mode='normal'):
+	''' given a starting (string,fret) location and the scale notes on the neck (see 
+	scaleOnNeck) calculate a two octave scale across the strings
+	returns a list of (string, fret)
+	modes:
+	normal                          : referenceFret is the starting fret
+	down                                  : referenceFret continually updated
+	open                                  : favor open strings
+	FourOnString  : favor 4 notes per string (max)'''
+	intervals = scaleIntervalSteps(scaleintervals)
+	scale_notes = scaleNotes
+	fretsOnStrings = []
+	tonesOnStrings = []
+	
+	for i,string in enumerate(scale_notes):
+		frets = [x[0] for x in string]
+		fretsOnStrings.append(frets)
+		tones = [x[0] + tuning[i] for x in string]
+		tonesOnStrings.append(tones)
+		
+	tonesOnStrings.append([-1 for x in range(len(tonesOnStrings[0]))])
+	
+	numNotes = 2*len(scaleintervals) + 1
+	numStrings = len(tuning)
+	thisString,thisStringFret = location
+	
+	tone = thisStringFret + tuning[thisString]
+	tonesInTwoOctaveScale = [tone]
+	for octave in [1,2]:
+		for interval in intervals[1:]:
+			tone += interval
+			tonesInTwoOctaveScale.append(tone)
+	referenceFret = thisStringFret # used to anchor the scale
+	if thisStringFret not in fretsOnStrings[thisString]:
+		raise ValueError('fret {} is not a scale note on string {}'.format(thisStringFret,thisString))
+	thisIndex = fretsOnStrings[thisString].index(thisStringFret)
+	scaleNotes = [location]
+	thisStringCount = 1 if thisStringFret else 0
+	nextStringNote = scale_notes[thisString+1][1]
+	nextIndex = 0
+	# always look to see if next note is on next string
+	for nextTone in tonesInTwoOctaveScale[1:]: # first tone already in place
+		try:
+			thisIndex = tonesOnStrings[thisString][thisIndex:].index(nextTone) + thisIndex
+			onThisString = True
+		except ValueError:
+			onThisString = False
+		try:
+			nextIndex = tonesOnStrings[thisString+1][nextIndex:].index(nextTone) + nextIndex
+			onNextString = True
+		except ValueError:
+			nextIndex = 0
+			onNextString = False
+			
+		if not onThisString: #not on this string
+			if not onNextString: # nor here, must be done.
+				return scaleNotes
+			else: # not on current string, is on next string, save and update
+				nextFret = fretsOnStrings[thisString+1][nextIndex]
+				scaleNotes.append((thisString+1,nextFret))
+				if mode == 'down':
+					referenceFret = nextFret
+				thisString += 1
+				if thisString == numStrings + 1: # on phantom string
+					return scaleNotes
+				thisIndex = nextIndex
+				nextIndex = 0
+				thisStringCount = 1 if nextFret else 0
+		else:
+			if onNextString: # On both strings
+				thisFret = fretsOnStrings[thisString][thisIndex]
+				nextFret = fretsOnStrings[thisString+1][nextIndex]
+				thisDelta = abs(referenceFret - thisFret)
+				nextDelta = abs(referenceFret - nextFret)
+				if mode == 'open':
+					if nextFret == 0:
+						scaleNotes.append((thisString+1,0))
+						thisString += 1
+						thisIndex = nextIndex
+						continue # next tone
+				if mode == 'FourOnString' and thisStringCount == 4:
+					thisString += 1
+					scaleNotes.append((thisString,nextFret))
+					thisIndex = nextIndex
+					thisStringCount = 1 if nextFret else 0
+					continue
+				if thisDelta < nextDelta: # stay in this string
+					scaleNotes.append((thisString,thisFret))
+					if mode == 'down':
+						referenceFret = thisFret
+				else:
+					thisString += 1
+					scaleNotes.append((thisString,nextFret))
+					if mode == 'down':
+						referenceFret = nextFret
+					thisIndex = nextIndex
+					nextIndex = 0
+					thisStringCount = 1
+			else: #just on this string
+				thisFret = fretsOnStrings[thisString][thisIndex]
+				scaleNotes.append((thisString,thisFret))
+				if thisFret: #don't count open string as a fingerednote
+					thisStringCount += 1
+				if mode == 'down':
+					referenceFret = fretsOnStrings[thisString][thisIndex]
+	return scaleNotes
+	
+	
+#--- chord identification
+
+# The chords a set of notes spells depend only on its pitch class set, so they are looked
+# up in a table of all 4096 sets, built once for the chord types.  Besides the exact 
+# matches, a set matches a chord if they differ by just the root, 3rd or 5th (the 
+# symmetric difference of the two is that one note)
+
+MISSING_TONES = [(0,'no root'), (3,'no 3rd'), (4,'no 3rd'), (7,'no 5th')]
+
+# ranked identification, the cost of each interval above the root when the chord has it but
+# the notes do not (missing) or the notes have it but the chord does not (extra).  Root and
+# 3rd matter most, a missing 5th or an added 9th, 11th or 13th hardly at all
+MISSING_WEIGHTS = [4, 3, 3, 3, 3, 3, 3, 1, 3, 3, 2, 2]
+EXTRA_WEIGHTS   = [2, 3, 1, 3, 3, 1, 3, 2, 3, 1, 3, 3]
+INTERVAL_NAMES  = ['R', 'b9', '9', 'b3', '3', '11', 'b5', '5', '#5', '13', 'b7', '7']
+
+# chord tone in the bass, by its position in the chord type
+INVERSION_NAMES = ['root position', '1st inversion', '2nd inversion', '3rd inversion', 
+					'4th inversion', '5th inversion', '6th inversion']
+
+def rotatePitchClassSet(pcs, root):
+	''' the pitch class set relative to root, bit n is set if root + n is present'''
+	return ((pcs >> root) | (pcs << (12 - root))) & 0xfff
+	
+def addWeighted(counter, vector, weight):
+	''' add weight to the bit sliced counter for every bit set in vector.
+	counter[s] holds bit s of each count, one count per bit position'''
+	bit = 0
+	while weight >> bit:
+		if (weight >> bit) & 1:
+			carry = vector
+			s = bit
+			while carry:
+				while s >= len(counter):
+					counter.append(0)
+				counter[s],carry = counter[s] ^ carry, counter[s] & carry
+				s += 1
+		bit += 1
+
+class ChordIndex(object):
+	''' chord identification by table lookup.  chordTypes is a list of (name, chord) '''
+	def __init__(self,chordTypes):
+		self.chordTypes = list(chordTypes)
+		# for each pitch class set, None or ([(root, name)...], [(root, name, missing)...])
+		self.table = [None]*4096
+		# for each (bass pitch class, pitch class set), [(root, name, inversion or None for a slash chord)...]
+		self.bassTable = {}
+		self.typeOrder = dict([(name,n) for n,(name,chord) in reversed(list(enumerate(self.chordTypes)))])
+		for root in range(12):
+			for name,chord in self.chordTypes:
+				pcs = pitchClassSet(chord,root)
+				self.entry(pcs)[0].append((root,name))
+				for tone,missing in MISSING_TONES:
+					self.entry(pcs ^ (1 << ((root + tone) % 12)))[1].append((root,name,missing))
+				# the same chord over each bass, an inversion if the bass is a chord tone,
+				# else a slash chord with the bass added (not for dyads, C5/E is C/E)
+				tones = []
+				for tone in chord:
+					if (root + tone) % 12 not in tones:
+						tones.append((root + tone) % 12)
+				for bass in range(12):
+					if bass in tones:
+						self.bassTable.setdefault((bass,pcs),[]).append((root,name,tones.index(bass)))
+					elif len(tones) > 2:
+						self.bassTable.setdefault((bass,pcs | (1 << bass)),[]).append((root,name,None))
+		# for rank, the distinct root relative pitch class sets (shapes) with their names,
+		# stored bit sliced: bit k of columns[n] is set if shape k has the interval n
+		self.shapes = []
+		self.shapeNames = []
+		for name,chord in self.chordTypes:
+			shape = pitchClassSet(chord)
+			if shape in self.shapes:
+				self.shapeNames[self.shapes.index(shape)].append(name)
+			else:
+				self.shapes.append(shape)
+				self.shapeNames.append([name])
+		self.columns = [sum([((shape >> n) & 1) << k for k,shape in enumerate(self.shapes)])
+							for n in range(12)]
+		self.allShapes = (1 << len(self.shapes)) - 1
+					
+	def entry(self,pcs):
+		if self.table[pcs] is None:
+			self.table[pcs] = ([],[])
+		return self.table[pcs]
+		
+	def identify(self,notes,noteNames,bass=None):
+		''' the chords that the notes spell exactly, then those missing just the root, 3rd or 5th.
+		With the bass (the lowest sounding note) the exact matches are named over it, root 
+		positions and inversions in chord type order, then slash chords.
+		The result is a list of table items, with a separator after each group'''
+		chord_list = []
+		if not notes:
+			return chord_list
+		pcs = pitchClassSet(notes)
+		if bass is not None:
+			chord_list = self.identifyBass(pcs,bass % 12,noteNames)
+		matches = self.table[pcs]
+		if matches is None:
+			return chord_list
+		exact,missing = matches
+		if bass is not None:
+			exact = []
+		for root,name in exact:
+			chord_list.append({'title':"{}{}".format(noteNames[root],name),'root':root,
+			'chord':name, 'accessory_type':'none'})
+		if exact:
+			chord_list.append({'title':"-------",'root':-1, 'chord':-1, 'accessory_type':'none'})
+		for root,name,omitted in missing:
+			chord_list.append({'title':"{}{} ({})".format(noteNames[root],name,omitted),'root':root,
+			'chord':name, 'accessory_type':'none'})
+		if missing:
+			chord_list.append({'title':"-------",'root':-1, 'chord':-1, 'accessory_type':'none'})
+		return chord_list
+		
+	def identifyBass(self,pcs,bass,noteNames):
+		''' the chords in pcs over the bass pitch class, from the bass table'''
+		chord_list = []
+		matches = self.bassTable.get((bass,pcs),[])
+		ordered = sorted(matches,key=lambda match: (match[2] is None, self.typeOrder[match[1]]))
+		for root,name,inversion in ordered:
+			if inversion == 0:
+				title = "{}{}".format(noteNames[root],name)
+			elif inversion is None:
+				title = "{}{}/{}".format(noteNames[root],name,noteNames[bass])
+			else:
+				title = "{}{}/{} ({})".format(noteNames[root],name,noteNames[bass],INVERSION_NAMES[inversion])
+			chord_list.append({'title':title,'root':root,'chord':name,'bass':bass,
+			'inversion':inversion,'accessory_type':'none'})
+		if chord_list:
+			chord_list.append({'title':"-------",'root':-1, 'chord':-1, 'accessory_type':'none'})
+		return chord_list
+		
+	def scores(self,relative):
+		''' the scores of every shape against the root relative pitch class set, bit sliced'''
+		counter = []
+		for n in range(12):
+			if (relative >> n) & 1:
+				addWeighted(counter,self.allShapes & ~self.columns[n],EXTRA_WEIGHTS[n])
+			else:
+				addWeighted(counter,self.columns[n],MISSING_WEIGHTS[n])
+		return counter
+		
+	def rank(self,notes,noteNames,limit=10):
+		''' every (root, chord type) scored by the weighted tones the notes are missing from the
+		chord and those they add to it, the limit best as table items, best first.
+		The scores of all the shapes for a root are computed at once, each bit slice of the 
+		counters is a big integer with a bit per shape, so the cost hardly grows with the 
+		number of chord types'''
+		chord_list = []
+		if not notes or not self.shapes:
+			return chord_list
+		pcs = pitchClassSet(notes)
+		counters = [self.scores(rotatePitchClassSet(pcs,root)) for root in range(12)]
+		width = max([len(counter) for counter in counters])
+		found = []
+		for score in range(1 << width):
+			for root,counter in enumerate(counters):
+				hits = self.allShapes
+				for s in range(width):
+					bits = counter[s] if s < len(counter) else 0
+					hits &= bits if (score >> s) & 1 else ~bits
+				while hits:
+					low = hits & -hits
+					hits ^= low
+					shape = low.bit_length() - 1
+					found.extend([(score,shape,root,name) for name in self.shapeNames[shape]])
+			if len(found) >= limit:
+				break
+		found.sort(key=lambda item: item[:3])
+		for score,shape,root,name in found[:limit]:
+			relative = rotatePitchClassSet(pcs,root)
+			tones = ['no ' + INTERVAL_NAMES[n] for n in range(12) if (self.shapes[shape] & ~relative) >> n & 1]
+			tones += ['add ' + INTERVAL_NAMES[n] for n in range(12) if (relative & ~self.shapes[shape]) >> n & 1]
+			title = "{}{}".format(noteNames[root],name)
+			if tones:
+				title += " ({})".format(', '.join(tones))
+			chord_list.append({'title':title,'root':root,'chord':name,'score':score,'accessory_type':'none'})
+		return chord_list
+		
+def identifyChords(notes,chordTypes,noteNames,bass=None):
+	''' ChordIndex(chordTypes).identify, for a one off identification'''
+	return ChordIndex(chordTypes).identify(notes,noteNames,bass)
@@ -40,6 +40,11 @@ button_save         - bring up a menu to save the current state of the filters,
 button_load         - bring up a menu to load a saved state
 button_config       - save current configuration
 button_new          - brings up the instrument builder
+sc_engine           - fingering search backend, python or numpy
+sc_ranking          - all fingerings, or only the most playable in score order
+sc_workers          - number of processes for the fingering search
+sc_findranking      - identify exact matches, or rank the best partial and extended chords
+button_findwave     - identify the chord of a WAV recording
 """
 
 import sys
@@ -64,10 +69,19 @@ import chordcalc_constants as cccInit
 import Spinner; importlib.reload(Spinner);   from Spinner import Spinner
 import Shield; importlib.reload(Shield);     from Shield import Shield
 import DropDown; importlib.reload(DropDown); from DropDown import DropDown
+import ccengine, ccengine.numpyEngine, ccengine.audio
+for module in ccengine.MODULES: importlib.reload(importlib.import_module('ccengine.' + module))
+importlib.reload(ccengine); from ccengine import *
 
 SettingsFileName = 'settings.ini'
 ConfigFileName = 'config.ini'
 
+# (title, value) of the segments of the search and identify option controls
+ENGINE_CHOICES = [('python','python'), ('numpy','numpy')]
+RANKING_CHOICES = [('all',None), ('best 10',10)]
+WORKER_CHOICES = [('in process',0), ('2 processes',2), ('4 processes',4)]
+FIND_RANKING_CHOICES = [('exact chords',None), ('best 10 by score',10)]
+
 #--- CCC 
 class CCC(object):
 	''' chordcalc constants '''
@@ -156,10 +170,12 @@ class CCC(object):
 		'accessory_type':'none'} for capo in capos.items] ########
 		
 		cccOut['TUNING_LIST_CLEAN'] = [{'title':tuning['title'],'notes':tuning['notes'],
-		'span':tuning['span'],'octave':tuning['octave'],'accessory_type':'none'}
+		'span':tuning['span'],'octave':tuning['octave'],
+		'frets':tuning.get('frets',cccInit.NUM_FRETS_DEFAULT),'accessory_type':'none'}
 		for tuning in instrument.items] #####
 		
-		cccOut['TUNINGS'] = [(tuning['title'], [tuning['notes'],tuning['span']],tuning['octave'])
+		cccOut['TUNINGS'] = [(tuning['title'], [tuning['notes'],tuning['span']],tuning['octave'],
+		tuning.get('frets',cccInit.NUM_FRETS_DEFAULT))
 		for tuning in instrument.items] #####
 		
 		cccOut['FILTER_LIST_CLEAN'] = []
@@ -325,6 +341,9 @@ class CCC(object):
 
 class Model(object):
 	''' primary ChordCalc Model '''
+	# filters that change which fingerings the search finds, the others only narrow the result
+	SEARCH_FILTERS = ('FULL_CHORD', 'NOROOT_OK', 'NO3RD_OK', 'NO5TH_OK')
+	
 	def __init__(self,ccc):
 		self._Constants = cccInit # master database for constants	
 		self._ccc = ccc       # constants form configurato file, dictionary of lists/dictionalies
@@ -338,12 +357,15 @@ class Model(object):
 		self._InstrumentOctave = None
 		self._Filters = None  # ('filtername1', 'filtername2',........)
 		self._Capos = {}   # {fretnumber:(0/1,0/1,....),} 			
+		self._CapoOffsets = ()  # (int,...) nut fret of each string, see updateCapoOffsets
 		self._ScaleName = ''	  # ('scalename','interval string TS3#')
 		self._ScaleIntervals = ''
 		self._Span = None	  # int number of frets to search for a chord range	
 		self._playbackSpeed = None  # int
 		self._Volume = None # int number
 		self._Fingerings = []	
+		self._RawFingerings = []   # unfiltered fingerings for the current chord
+		self._RawFingeringsKey = None
 		self._FingeringPointer = 0
 		self._NumberofFingerings = None
 		self._ChordNotes = ''		
@@ -358,12 +380,17 @@ class Model(object):
 		self._TwoOctaveScale=None
 		self._FindKey = None
 		self._FindChord = None
+		self._Engine = 'python'     # str in ('python', 'numpy') fingering search backend
+		self._RankLimit = None      # int, show only the k most playable fingerings, best first
+		self._FindLimit = None      # int, identify by score and show the k best chords
+		self._Workers = 0           # int, number of search processes, 0 searches in process
+		self._Pool = None           # ProcessPoolExecutor, started on first use when _Workers
 
 
 #--- ---fretboard constants
 
 		self.fretboard_NutOffset = 20
-		self.fretboard_NumFrets = 14
+		self.fretboard_NumFrets = cccInit.NUM_FRETS_DEFAULT  # per instrument, see changeInstrument
 		self.fretboard_OffsetFactor = 0.1
 		self.fretboard_MarkerRadius = 10
 		self.fretboard_FingerRadius = 15
@@ -378,6 +405,33 @@ class Model(object):
 		self.play_arpMin = 0.05
 		self.play_arpMax = 0.5
 		self.play_arpSpeed = (self.play_arpMax + self.play_arpMin)/2.0
+		
+#--- ---cache constants
+
+		self.cache_FingeringSize = 64
+		self._FingeringCache = LRUCache(self.cache_FingeringSize)
+		self._ShapeCache = ShapeCache()  # movable shapes, shared across roots
+		
+#--- ---fingering database constants
+
+		self.db_FileName = ccengine.database.DB_FILE_NAME
+		self._FingeringDB = None
+		self._FingeringDBChecked = False
+		self._TuningDBs = {}   # (tuning, is 5 string banjo) -> its own database, None while it is built
+		
+#--- ---prefetch constants
+
+		self.prefetch_Delay = 0.05     # idle time before (and between) prefetch steps
+		self.prefetch_Chunk = 16       # fingerings generated per prefetch step
+		self._PrefetchGeneration = 0   # bumped by real input, stale prefetch steps stop
+		self._PrefetchQueue = []      # (key, root value, chord tones, fingerings so far or None)
+		
+#--- ---computation constants
+
+		self.compute_Delay = 0.02      # idle time before (and between) the steps of a computation
+		self.compute_Chunk = 32        # fingerings searched per step
+		self._Generation = 0           # bumped by every request, older computations stop
+		self._Computing = None         # generation of the computation in progress, if any
 											
 		pub.subscribe(self.changeMode,'changemode')	
 		pub.subscribe(self.changeRoot,'changeroot')
@@ -397,6 +451,10 @@ class Model(object):
 		pub.subscribe(self.setFindScale,'updatefindscale')
 		pub.subscribe(self.setCapoFret,'setcapofret')
 		pub.subscribe(self.changeSettings,'changesettings')
+		pub.subscribe(self.changeEngine,'changeengine')
+		pub.subscribe(self.changeRanking,'changeranking')
+		pub.subscribe(self.changeFindRanking,'changefindranking')
+		pub.subscribe(self.changeWorkers,'changeworkers')
 			
 		######################################		
 		#handy status variable
@@ -412,13 +470,13 @@ class Model(object):
 	def changeChord(self,name=None, chordTones=None):
 		self._ChordName = name
 		self._ChordNoteValues = chordTones
-		self._Fingerings = self.calc_fingerings()
+		self.requestFingerings()
 		self.updateFretboard()
 		
 	def changeRoot(self, root=None, value=None):
 		self._RootNoteValue = value
 		self._RootNoteName = root
-		self._Fingerings = self.calc_fingerings()
+		self.requestFingerings()
 		self._TwoOctaveScale = []
 		self.updateFretboard()
 		
@@ -446,8 +504,9 @@ class Model(object):
 			del self._Capos[fret]
 		else:
 			self._Capos[fret] = mask
+		self.updateCapoOffsets()
 		if self._Mode == "C":
-			self._Fingerings = self.calc_fingerings()	
+			self.requestFingerings()
 		# clear out any only fretboard displaying lists
 		self._ChordScale = []
 		self._showChordScale = False
@@ -459,15 +518,17 @@ class Model(object):
 		self._InstrumentTuning = data['notes']
 		self._InstrumentType = self.instrument_type()
 		self._InstrumentOctave = data['octave']
+		self.fretboard_NumFrets = data.get('frets',cccInit.NUM_FRETS_DEFAULT)
 		self._is5StringBanjo = (self._InstrumentType[0] == 'banjo' and 
 										len(self._InstrumentTuning) == 5)
 		self._ShowChordScale = False
 		self._ChordScale = []
 		self._TwoOctaveScale = []
-		self._Fingerings = self.calc_fingerings()
+		self._Capos = {}
+		self.updateCapoOffsets()
+		self.requestFingerings()
 		self._FindKey = None
 		self._FindChord = []
-		self._Capos = {}
 		
 		pub.sendMessage('update.tuningbuttontext',text=self._InstrumentTuning)
 		pub.sendMessage('syncspanspinner',span=self._Span)
@@ -482,6 +543,8 @@ class Model(object):
 	def updateFretboard(self):
 		if not self._InstrumentTuning:
 			return	
+		if self._Computing: # the fingerings are out of date, the computation will publish
+			return
 		if self._Mode == 'C': # chord Finder
 			if (self._ChordNoteValues and self._RootNoteName):
 				self._ChordScale = self.calc_chord_scale()
@@ -503,6 +566,7 @@ class Model(object):
 											chordScale = self._ChordScale,
 											twoOctaveScale = self._TwoOctaveScale,
 											tuning=self._InstrumentTuning,
+											numFrets=self.fretboard_NumFrets,
 											type = self._InstrumentType,
 											is5StringBanjo = self._is5StringBanjo,
 											root = self._RootNoteName,
@@ -584,7 +648,7 @@ class Model(object):
 		
 	def changeFilters(self,filters=None):
 		self._Filters = filters
-		self._Fingerings = self.calc_fingerings()
+		self.requestFingerings()
 		self.updateFretboard()
 		
 	def changeSettings(self,settings=None):
@@ -620,12 +684,59 @@ class Model(object):
 					capos.items[i]['accessory_type'] = 'checkmark'
 					capos.items[i]['fret'] = int(capo[1])
 					self._Capos[int(capo[1])] = capos.items[i]['mask']
+		self.updateCapoOffsets()
 		capos.delegator.reload_data()
 		mainView['view_settingsView'].hidden = True
 		#%%%%%%%
 		mainViewShield.reveal()
 	
 		
+	def changeEngine(self,engine=None):
+		''' select the fingering search backend, 'python' or 'numpy' '''
+		if engine == 'numpy' and not ccengine.numpyEngine.available:
+			console.hud_alert('numpy not available, using python search','error',2)
+			engine = 'python'
+		self._Engine = engine
+		pub.sendMessage('syncengine',engine=engine)
+		if self._Mode == 'C':
+			self.requestFingerings()
+		self.updateFretboard()
+		
+	def changeRanking(self,limit=None):
+		''' show the limit most playable fingerings in score order, or (None) all of them 
+		in the order they are found'''
+		self._RankLimit = limit or None
+		if self._Mode == 'C':
+			self.requestFingerings()
+		self.updateFretboard()
+		
+	def changeFindRanking(self,limit=None):
+		''' identify chords by score and show the limit best, partial and extended voicings 
+		included, or (None) only the exact matches and those missing the root, 3rd or 5th'''
+		self._FindLimit = limit or None
+		if self._Mode == 'I' and find.query: # the shown chords are found again with the new ranking
+			pub.sendMessage('updatefind',chordlist=findChords(*find.query))
+		
+	def changeWorkers(self,workers=0):
+		''' opt in to searching the neck positions in a pool of worker processes'''
+		if self._Pool:
+			self._Pool.shutdown(wait=False)
+			self._Pool = None
+		self._Workers = workers or 0
+		
+	def searchPool(self):
+		''' the process pool for the search, or None to search in process'''
+		if not self._Workers:
+			return None
+		if not self._Pool:
+			try:
+				self._Pool = ccengine.search.ProcessPoolExecutor(max_workers=self._Workers)
+			except (OSError,NotImplementedError): # no process support on this platform
+				console.hud_alert('no worker processes, searching in process','error',2)
+				self._Workers = 0
+				pub.sendMessage('syncworkers',workers=0)
+		return self._Pool
+		
 	def changeSpeed(self,**kwargs):
 		pass
 		
@@ -633,11 +744,13 @@ class Model(object):
 		pass
 		
 	def changeFingering(self,pointer=None):
+		self.cancelPrefetch()
 		self._FingeringPointer = pointer
 		self.updateFretboard()
 						
 	def changeSpan(self,data=None):
 		self._Span = data
+		self.requestFingerings()
 		self.updateFretboard()
 				
 	def changeConfig(self,**kwargs):
@@ -683,405 +796,251 @@ class Model(object):
 		
 	def calc_fingerings(self):
 		'''calculate the fingerings and fretboard positions for the desired chord'''
-		if self._RootNoteName: # remember the note value of "C" is =
-			key = self._RootNoteValue
-			note = self._RootNoteName  # since "C" has a note value of zero, use note title as indicator
-		else:
+		steps = self.fingeringSteps()
+		while True:
+			try:
+				next(steps)
+			except StopIteration as done:
+				return done.value
+				
+	def fingeringSteps(self):
+		''' calc_fingerings as a generator, yielding between chunks of the search so it can be
+		run a step at a time and abandoned part way.  Returns the fingerings'''
+		if not self._RootNoteName: # since "C" has a note value of zero, use note title as indicator
 			return None
-		if self._ChordName:
-			chordtype = self._ChordName
-		else:
+		if not self._ChordName:
 			return None
-		if self._InstrumentName:
-			tuning = self._InstrumentTuning
-			span = self._Span
-		else:
+		if not self._InstrumentName:
 			return None
 			
-		filterSet = self._Filters if self._Filters else []
-			
-		result = None
-		fingerPositions = []
-		fingerings = []
-		result = []
-		for position in range(0,fretboard.numFrets-span):
-			fingeringThisPosition = self.findFingerings(position)
-			if fingeringThisPosition:
-				fingerings = fingerings + fingeringThisPosition
-		fingerings = uniqify(fingerings,idfun=(lambda x: tuple(x)))
-		if fingerings:
-			for fingering in fingerings:
-				fingerMarker = fretboard.fingeringDrawPositions(key,chordtype,tuning,fingering)
-				fingerPositions.append(fingerMarker)
-			for fingering,drawposition in zip(fingerings,fingerPositions):
-				chordTones = []
-				for entry in drawposition:
-					chordTones.append(entry[2])
-				result.append((drawposition,chordTones,fingering))
-			if filters:
-				result = apply_filters(filterSet, result)
-				if result:
-					result = uniqify(result,idfun=(lambda x: tuple(x[2])))
 		self._FingeringPointer = 0 
+		self.cancelPrefetch()
+		cacheKey = self.fingeringQueryKey()
+		result = self._FingeringCache.get(cacheKey)
+		if result is not None:
+			self.schedulePrefetch()
+			return result
+		# only the filters that change the search need a new one, the rest just narrow 
+		# the unfiltered fingerings that are kept for the current chord
+		searchKey = self.fingeringQueryKey(searchOnly=True)
+		if searchKey != self._RawFingeringsKey:
+			self._RawFingerings = self.search_fingerings()
+			self._RawFingeringsKey = searchKey
+		# the narrowed fingerings are stepped, and the search behind them, until ranking has
+		# read every fingering, otherwise until there is a chunk to show.  An abandoned search 
+		# is kept in _RawFingerings, and resumes if the query comes back
+		result = self.narrow_fingerings(self._RawFingerings,rank=False)
+		while not result.complete and (self._RankLimit or result.found < self.compute_Chunk):
+			result.advance(self.compute_Chunk)
+			yield
+		if self._RankLimit:
+			result = rankFingerings(result,self._RankLimit)
+		self._FingeringCache.put(cacheKey,result)
+		self.schedulePrefetch()
 		return result
 		
-		
-	def findFingerings(self,position):
-		# Get valid frets on the strings
-		
-		validfrets = self.findValidFrets(position)
-		
-		# Find all candidates
-		candidates = self.findCandidates(validfrets)
-		
-		# Filter out the invalid candidates
-		candidates = self.filterCandidates(candidates)
-		
-		return candidates
-		
-	# For a given list of starting frets and span, find the ones that are in the chord for that tuning
-	# Returns a list of valid frets for each string
-	# Open strings are included if valid
-	
-	def findValidFrets(self,position):	
-		strings = []
-		nutOffsets = self.capoOffsets()
-		for i,string in enumerate(self._InstrumentTuning):
-			# offset 5 string banjo
-			if self._is5StringBanjo and i == 0:
-				string -= self.fretboard_fret5thStringBanjo
-			frets = []
-			if nutOffsets[i] <= position:
-				start = position
-				stop = position + self._Span+1
-			elif position <= nutOffsets[i] <= position+self._Span+1:
-				start = nutOffsets[i]
-				stop = position + self._Span+1
-			else: #behind the capo
-				continue
-			searchrange = [x for x in range(start,stop)]
-			if position != 0: # include open strings is not at pos 0
-				searchrange = [nutOffsets[i]] + searchrange
-			for fret in searchrange:
-				for chordrelnote in self._ChordNoteValues:
-					note = (string + fret) % 12
-					chordnote = (self._RootNoteValue + chordrelnote) % 12
-					if note == chordnote:
-						frets.append(fret)
-			strings.append(frets)
-		return strings
-		
-		
-		
-	# Finds all candidate fingerings, given all valid frets
-	# Includes strings that should not be played
-	# Note that this is just a permutation function and is independent of keys, tunings or chords
-	
-	
-	
-	def findCandidates(self,validfrets):
-		# Set up the counter which will track the permutations
-		max_counter = []
-		counter = []
-		candidatefrets = []
-		if not validfrets:
-			return None
-		for string in validfrets:
-			# Include the possibility of not playing the string
-			# Current approach prioritises open and fretted strings over unplayed strings
-			candidatefrets.append(string + [-1])
-			max_counter.append(len(string))
-			counter.append(0)
-		l = len(counter)-1
-		
-		# Number of possible permutations
-		numperm = 1
-		for c in max_counter:
-			numperm *= c+1
-			
-		candidates = []
-		# Permute
-		for perm in range(numperm):
-			# get the candidate
-			candidate = []
-			for string, fret in enumerate(counter):
-			
-				candidate.append(candidatefrets[string][fret])
-				
-			# increment counter, starting from highest index string
-			for i, v in enumerate(counter):
-				if counter[l-i] < max_counter[l-i]:
-					counter[l-i] += 1
-					break
-				else:
-					counter[l-i] = 0
-					
-			candidates += [candidate]
-		return candidates
-		
-		
-		
-	# Tests whether a fingering is valid
-	# Should allow various possibilities - full chord, no 5th, no 3rd, no root, etc
-	
-	def isValidChord(self,candidate):
-		filterSet = self._Filters
-		if not filterSet:
-			filterSet = []
-			
-		result = True
-		
-		# which chord notes are present?
-		present = {}
-		for chordrelnote in self._ChordNoteValues:
-			# assume chord notes are not present
-			present[chordrelnote] = False
-			chordnote = (self._RootNoteValue + chordrelnote) %12
-			for i, v in enumerate(candidate):
-				# ignore unplayed strings
-				if candidate[i] != -1:
-					note = (self._InstrumentTuning[i] + candidate[i]) % 12
-					if chordnote == note:
-						present[chordrelnote] = True
-						break
-						
-						
-		# do we accept this fingering? depends on the option
-		for note in present.keys():
-			if present[note] == False:
-				if 'FULL_CHORD' in filterSet:
-					result = False
-					break
-				if 'NO3RD_OK' in filterSet:
-					if note == 4 or note == 3:
-						continue
-				if 'NO5TH_OK' in filterSet:
-					if note == 7:
-						continue
-				if 'NOROOT_OK' in filterSet:
-					if note == 0:
-						continue
-			result = result & present[note]
+	def requestFingerings(self):
+		''' recalculate the fingerings while the ui stays live.  Each request gets a new 
+		generation and runs a step at a time, a newer request stops the older ones at their 
+		next step so only the latest is ever published on update.fretboard'''
+		self._Generation += 1
+		self._Computing = generation = self._Generation
+		self.cancelPrefetch()
+		steps = self.fingeringSteps()
+		ui.delay(lambda: self.computeStep(generation,steps),self.compute_Delay)
+		
+	def computeStep(self,generation,steps):
+		''' run the next step of a computation, publishing the fingerings when it is done'''
+		if generation != self._Generation: # superseded
+			steps.close()
+			return
+		try:
+			next(steps)
+		except StopIteration as done:
+			self._Fingerings = done.value
+			self._Computing = None
+			self.updateFretboard()
+			return
+		except Exception:
+			self._Computing = None
+			raise
+		ui.delay(lambda: self.computeStep(generation,steps),self.compute_Delay)
+		
+	def narrow_fingerings(self,result,rank=True):
+		''' apply the narrowing filters, then the ranking unless rank is False, to the 
+		fingerings for a query'''
+		filterSet = self._Filters if self._Filters else []
+		if filterSet:
+			result = apply_filters(filterSet,result,self._InstrumentType[0])
+		if rank and self._RankLimit:
+			result = rankFingerings(result,self._RankLimit)
 		return result
 		
-		
-	# Tests if a given note is in the chord
-	# Not used here
-	
-	
-		
-	# Filter out the invalid chords from the list of candidates
-	# Criteria for invalid chords may vary
-	# Returns the list of valid chords
-	
-	def filterCandidates(self,candidates):	
-		if not candidates:
+	def search_fingerings(self,root=None,chord=None):
+		''' find the fingerings for the current chord (before any narrowing filters)
+		or for root and chord if given.
+		returns a lazy sequence of Fingering records, in display order. 
+		The search only runs as far as the fingerings asked for'''
+		search = FingeringSearch.fromModel(self,self.fretboard_NumFrets)
+		if root is not None:
+			search = search.withChord(root,chord)
+		return LazySequence(self.iter_fingerings(search,self.lookup_fingerings(search)))
+		
+	def lookup_fingerings(self,search):
+		''' the fingerings for search from the precomputed database, if it covers the query
+		(no capos, no search filters and the default span), otherwise None'''
+		if self._Capos or search.filters and set(search.filters) & set(self.SEARCH_FILTERS):
 			return None
-		newlist = []
-		for candidate in candidates:
-			if self.isValidChord(candidate):
-				newlist += [candidate]
-		return newlist
-			
-	def fingeringDrawPositions(self,fingering):
-		""" given a fingering,chord and tuning information and virtual neck info,
-		return the center positions all markers.  X and open strings will be
-		marked at the nut"""
-		scaleNotes = self.getScaleNotes(key, chordtype, tuning, fingering)
-		#if len(scaleNotes) != len(fingering):
-		chordDrawPositions = []
-		numStrings,offset,ss = self.stringSpacing()
-		for i,fretPosition in enumerate(fingering): #loop over strings, low to high
-			try:
-				note = scaleNotes[i]
-			except:
-				continue
-			atNut = None
-			xpos = offset + i*ss
-			if fretPosition in [-1,0]: #marker at nut
-				ypos = int(0.5* self.nutOffset)
-				atNut = 'X' if fretPosition else 'O'
+		if search.numFrets > ccengine.database.MAX_FRETS:
+			return None
+		db = self.fingeringDatabase(search)
+		if not db:
+			return None
+		return db.lookup(search.tuning,search.is5StringBanjo,search.root,search.chord,
+							search.span,search.numFrets)
+							
+	def fingeringDatabase(self,search):
+		''' the precomputed fingering database for the search's tuning, opened on first use.
+		The catalog database if it is current, otherwise the tuning's own, which is built 
+		in the background if it is missing or out of date (the search is used meanwhile)'''
+		if not self._FingeringDBChecked:
+			self._FingeringDBChecked = True
+			if self._FingeringDB:
+				self._FingeringDB.close()
+			self._FingeringDB = ccengine.database.openCurrent(self.db_FileName)
+		if self._FingeringDB:
+			return self._FingeringDB
+		tuning = (tuple(search.tuning),search.is5StringBanjo)
+		if tuning not in self._TuningDBs:
+			db = ccengine.database.openCurrent(ccengine.database.tuningPath(self.db_FileName,*tuning))
+			if db:
+				self._TuningDBs[tuning] = db
+			elif ccengine.database.rebuildInBackground(self.db_FileName,tuning=tuning,
+										done=lambda: self.fingeringDatabaseBuilt(tuning)):
+				self._TuningDBs[tuning] = None
+		return self._TuningDBs.get(tuning)
+		
+	def fingeringDatabaseBuilt(self,tuning):
+		self._TuningDBs.pop(tuning,None) # reopen on the next lookup
+		
+	def iter_fingerings(self,search,source=None):
+		if source is None:
+			pool = self.searchPool()
+			if pool:
+				source = parallelFingerings(search,pool)
 			else:
-				ypos = self.fretboardYPos(fretPosition)
-			chordDrawPositions.append((xpos,ypos,note,atNut))
-		return chordDrawPositions
+				source = search.fingerings()
+		for frets in source:
+			yield Fingering(frets,search.getDegrees(frets),search.scaleNoteNames)
+		
+	def fingeringQueryKey(self,searchOnly=False,root=None,chord=None):
+		''' canonical, hashable description of everything calc_fingerings depends on 
+		or, if searchOnly, everything search_fingerings depends on.
+		root and chord replace the current ones if given'''
+		filterSet = self._Filters if self._Filters else []
+		if root is None:
+			root,chord = self._RootNoteValue,self._ChordNoteValues
+		rankLimit = self._RankLimit
+		if searchOnly:
+			filterSet = [filter for filter in filterSet if filter in self.SEARCH_FILTERS]
+			rankLimit = None
+		return (tuple(self._InstrumentTuning),
+				self._InstrumentType[0] if self._InstrumentType else None,
+				self._is5StringBanjo,
+				root,
+				tuple(chord),
+				self._Span,
+				self.fretboard_NumFrets,
+				self.capoOffsets(),
+				tuple(sorted(set(filterSet))),
+				rankLimit)
+		
+	def neighbourQueries(self):
+		''' (root value, chord tones) for the rows next to the current ones in the root
+		and chord type tables, the most likely next requests'''
+		queries = []
+		rows = [i for i,item in enumerate(root.items) if item['noteValue'] == self._RootNoteValue]
+		if rows:
+			for row in (rows[0]+1,rows[0]-1):
+				if 0 <= row < len(root.items):
+					queries.append((root.items[row]['noteValue'],self._ChordNoteValues))
+		rows = [i for i,item in enumerate(chord.items) if item['title'] == self._ChordName]
+		if rows:
+			for row in (rows[0]+1,rows[0]-1):
+				if 0 <= row < len(chord.items):
+					queries.append((self._RootNoteValue,chord.items[row]['fingering']))
+		return queries
+		
+	def schedulePrefetch(self):
+		''' fill the cache with the neighbouring queries while the ui is idle'''
+		self._PrefetchQueue = []
+		for rootValue,chordTones in self.neighbourQueries():
+			key = self.fingeringQueryKey(root=rootValue,chord=chordTones)
+			if key not in self._FingeringCache:
+				self._PrefetchQueue.append((key,rootValue,chordTones,None))
+		if self._PrefetchQueue:
+			generation = self._PrefetchGeneration
+			ui.delay(lambda: self.prefetchStep(generation),self.prefetch_Delay)
+		
+	def cancelPrefetch(self):
+		''' real input has arrived, any scheduled prefetch step will stop '''
+		self._PrefetchGeneration += 1
+		self._PrefetchQueue = []
+		
+	def prefetchStep(self,generation):
+		''' generate a few fingerings for the next queued neighbour then yield to the ui.
+		Runs on the main thread, so there is no locking around the cache'''
+		if generation != self._PrefetchGeneration or not self._PrefetchQueue:
+			return
+		key,rootValue,chordTones,result = self._PrefetchQueue[0]
+		if result is None: 
+			result = self.narrow_fingerings(self.search_fingerings(rootValue,chordTones),rank=False)
+			self._PrefetchQueue[0] = (key,rootValue,chordTones,result)
+			if not self._RankLimit: # a lazy result goes in the cache at once, later steps extend it
+				self._FingeringCache.put(key,result)
+		result.advance(self.prefetch_Chunk)
+		if result.complete:
+			if self._RankLimit: # ranked once every fingering has been found
+				self._FingeringCache.put(key,rankFingerings(result,self._RankLimit))
+			self._PrefetchQueue.pop(0)
+		if self._PrefetchQueue:
+			ui.delay(lambda: self.prefetchStep(generation),self.prefetch_Delay)
 		
-	def calc_two_octave_scale(self):
-		''' given a starting (string,scaletoneIndex) calculate a two octave scale across the 
-		strings
-		returns a 2D tupple of strings and frets
-		modes:
-		normal                          : referenceFret is the starting fret
-		down                                  : referenceFret continually updated
-		open                                  : favor open strings
-		FourOnString  : favor 4 notes per string (max)'''
 		
+	def calc_two_octave_scale(self):
+		''' given a starting (string,fret) calculate a two octave scale across the 
+		strings, see twoOctaveScale for the modes'''
 		mode = self.fretboard_mode if self.fretboard_mode else 'normal'
-		key = self._RootNoteValue
-		if self._ScaleIntervals:
-			scaleintervals = self._ScaleIntervals
-		else:
-			return None
-			
-		if self._InstrumentName:
-			tuning = self._InstrumentTuning
-		else:
+		if not self._ScaleIntervals or not self._InstrumentName:
 			return None
-			
-		intervals = [0]
-		for letter in scaleintervals:
-			if letter == 'S':
-				intervals.append(1)
-			elif letter == 'T':
-				intervals.append(2)
-			else:
-				intervals.append((int(letter)))
-				
-		nextNote = key
-		notesInScale = [nextNote,]
-		for interval in intervals[1:]:
-			nextNote += interval
-			notesInScale.append(nextNote % 12)
-			
-		scale_notes = self._ScaleNotes
-		fretsOnStrings = []
-		tonesOnStrings = []
-		
-		for i,string in enumerate(scale_notes):
-			frets = [x[0] for x in string]
-			fretsOnStrings.append(frets)
-			tones = [x[0] + tuning[i] for x in string]
-			tonesOnStrings.append(tones)
-			
-		tonesOnStrings.append([-1 for x in range(len(tonesOnStrings[0]))])
-		
-		numNotes = 2*len(scaleintervals) + 1
-		numStrings = len(tuning)
-		thisString,thisStringFret = self.fretboard_location
-		
-		tone = thisStringFret + tuning[thisString]
-		tonesInTwoOctaveScale = [tone]
-		for octave in [1,2]:
-			for interval in intervals[1:]:
-				tone += interval
-				tonesInTwoOctaveScale.append(tone)
-		referenceFret = thisStringFret # used to anchor the scale
 		try:
-			thisIndex = fretsOnStrings[thisString].index(thisStringFret)
-		except ValueError:
-			console.hud_alert('error, line793ish, see console')
-			print (fretsOnStrings[thisString], thisStringFret)
-		scaleNotes = [self.fretboard_location]
-		thisStringCount = 1 if thisStringFret else 0
-		nextStringNote = scale_notes[thisString+1][1]
-		nextIndex = 0
-		# always look to see if next note is on next string
-		for nextTone in tonesInTwoOctaveScale[1:]: # first tone already in place
-			try:
-				thisIndex = tonesOnStrings[thisString][thisIndex:].index(nextTone) + thisIndex
-				onThisString = True
-			except ValueError:
-				onThisString = False
-			try:
-				nextIndex = tonesOnStrings[thisString+1][nextIndex:].index(nextTone) + nextIndex
-				onNextString = True
-			except ValueError:
-				nextIndex = 0
-				onNextString = False
-				
-			if not onThisString: #not on this string
-				if not onNextString: # nor here, must be done.
-					return scaleNotes
-				else: # not on current string, is on next string, save and update
-					nextFret = fretsOnStrings[thisString+1][nextIndex]
-					scaleNotes.append((thisString+1,nextFret))
-					if mode == 'down':
-						referenceFret = nextFret
-					thisString += 1
-					if thisString == numStrings + 1: # on phantom string
-						return scaleNotes
-					thisIndex = nextIndex
-					nextIndex = 0
-					thisStringCount = 1 if nextFret else 0
-			else:
-				if onNextString: # On both strings
-					thisFret = fretsOnStrings[thisString][thisIndex]
-					nextFret = fretsOnStrings[thisString+1][nextIndex]
-					thisDelta = abs(referenceFret - thisFret)
-					nextDelta = abs(referenceFret - nextFret)
-					if mode == 'open':
-						if nextFret == 0:
-							scaleNotes.append((thisString+1,0))
-							thisString += 1
-							thisIndex = nextIndex
-							continue # next tone
-					if mode == 'FourOnString' and thisStringCount == 4:
-						thisString += 1
-						scaleNotes.append((thisString,nextFret))
-						thisIndex = nextIndex
-						thisStringCount = 1 if nextFret else 0
-						continue
-					if thisDelta < nextDelta: # stay in this string
-						scaleNotes.append((thisString,thisFret))
-						if mode == 'down':
-							referenceFret = thisFret
-					else:
-						thisString += 1
-						scaleNotes.append((thisString,nextFret))
-						if mode == 'down':
-							referenceFret = nextFret
-						thisIndex = nextIndex
-						nextIndex = 0
-						thisStringCount = 1
-				else: #just on this string
-					thisFret = fretsOnStrings[thisString][thisIndex]
-					scaleNotes.append((thisString,thisFret))
-					if thisFret: #don't count open string as a fingerednote
-						thisStringCount += 1
-					if mode == 'down':
-						referenceFret = fretsOnStrings[thisString][thisIndex]
-		return scaleNotes
-
+			return twoOctaveScale(self._InstrumentTuning,self._ScaleNotes,self._RootNoteValue,
+										self._ScaleIntervals,self.fretboard_location,mode)
+		except ValueError as error:
+			console.hud_alert('error, see console')
+			print (error)
+			return None
 		
 	def capoOffsets(self):
+		''' the offsets due to the applied capos, an immutable tuple'''
+		return self._CapoOffsets
+		
+	def soundingPitch(self,string,fret):
+		''' the pitch of string stopped at fret, frets count from the nut (so a capo is
+		already included), the 5th string of a banjo starts at its own nut'''
+		pitch = self._InstrumentTuning[string] + fret
+		if self._is5StringBanjo and string == 0:
+			pitch -= self.fretboard_fret5thStringBanjo
+		return pitch
+		
+	def updateCapoOffsets(self):
+		''' recalculate the capo offsets, whenever the capos or the instrument change'''
+		self._CapoOffsets = tuple(self.calcCapoOffsets())
+		
+	def calcCapoOffsets(self):
 		''' calculate and return the offsets due to the applied capos'''
-		numStrings = len(self._InstrumentTuning)
-		offsets = [0]*numStrings
-		if not self._is5StringBanjo:
-			for fret in self._Capos.keys():
-				mask = self._Capos[fret]
-				for i in range(numStrings):
-					value = fret if mask[i] else 0
-					offsets[i] = max(offsets[i],value)
-		else: # 5 string banjo
-			offsets = [self.fretboard_fret5thStringBanjo,0,0,0,0]
-			for fret in self._Capos.keys():
-				mask = self._Capos[fret]
-				if len(mask) == 1:
-				# is the fifth string
-					offsets[0] = max(offsets[0],fret)
-				else:
-					for i in range(1,5):
-						value = fret if mask[i] else 0
-						offsets[i] = max(offsets[i],value)
-		return offsets
-		
-	def getScaleNotes(self,fingering):
-		scalenotes = []
-		for i, v in enumerate(fingering):
-			if v == -1:
-				scalenotes.append('X')
-			else:
-				effTuning = self._InstrumentTuning[i]
-				if self._is5StringBanjo and i == 0:
-					effTuning = self._InstrumentTuning[i] - self.fretboard_fret5thStringBanjo
-					
-				fingerednote = (self._InstrumentTuning[i] + fingering[i]) % 12
-				for chordrelnote in self._ChordNoteValues:
-					chordnote = (self._RootNoteValue + chordrelnote) % 12
-					if fingerednote == chordnote:
-						scalenotes.append(ccc['SCALENOTES'][chordrelnote])
-		return scalenotes
+		return ccengine.capos.capoOffsets(self._Capos,len(self._InstrumentTuning),
+												self._is5StringBanjo,self.fretboard_fret5thStringBanjo)
 		
 	def calc_chord_scale(self,pKey=None, pChord=None): #
 		_key = pKey if self._Mode == 'I' else self._RootNoteValue
@@ -1091,220 +1050,26 @@ class Model(object):
 			_chord = self._ChordNoteValues
 		else:
 			return None
-		# calculate notes in the current key
-		chordNotes = [(x + _key) % 12 for x in _chord]
-		capoOffsets = self.capoOffsets()
-		scale = []
-		for i,openString in enumerate(self._InstrumentTuning):
-			thisString = []
-			for fret in range(capoOffsets[i],self.fretboard_NumFrets+1): # zero is the open string
-				tone = (openString + fret) %12
-				if tone in chordNotes:
-					thisString.append((fret-1,(tone - _key)%12))
-			scale.append(thisString)
-		return scale
+		return chordScaleOnNeck(self._InstrumentTuning,self.capoOffsets(),_key,_chord,
+										self.fretboard_NumFrets)
 		
 	def calc_scale_notes(self):
 		''' calculate the scale notes for the curent key, instrument and scale type'''
-		key = self._RootNoteValue
-		if self._ScaleName:
-			scaleintervals = self._ScaleIntervals
-		else:
+		if not self._ScaleName or not self._InstrumentTuning:
 			return None
-		if self._InstrumentTuning:
-			tuning = self._InstrumentTuning
-		else:
-			return None
-		# format of the returned data is [[[fret, scalenote, scaletone, octave],.....numer on string
+		# format of the returned data is [[[fret, scalenote],.....numer on string
 		#                                                                         ] length = numStrings
-		# first unpack the scale spacing from the string
-		
-		capoOffsets = self.capoOffsets()
-		intervals = [0]
-		for letter in scaleintervals:
-			if letter == 'S':
-				intervals.append(1)
-			elif letter == 'T':
-				intervals.append(2)
-			else:
-				intervals.append((int(letter)))
-				
-		nextNote = key
-		notes = [nextNote]
-		for interval in intervals[1:]:
-			nextNote += interval
-			notes.append(nextNote % 12)
-			
-		scaleNotes= []
-		for i,string in enumerate(tuning):
-			thisString = []
-			for fret in range(capoOffsets[i],self.fretboard_NumFrets+1):
-				note = (fret + string) % 12
-				if note in notes:
-					thisString.append((fret,note))
-			scaleNotes.append(thisString)
-		return scaleNotes
-		
+		return scaleOnNeck(self._InstrumentTuning,self.capoOffsets(),self._RootNoteValue,
+									self._ScaleIntervals,self.fretboard_NumFrets)
 
 		
 #===============================
 				
-def apply_filters(filters,fingerings):
-	''' for the current fingerings and filters, return only those chords that apply'''
-	filter_constraint = {'FULL_CHORD':("R b3 3 #5 5".split(),3)}
-	instrumentType,_ = model.instrument_type()
-	if not filters:
-		return fingerings
-	filtered = []
-	temp_fingerings = fingerings
-	if 'FULL_CHORD' in filters:   # must have at least R,3 and 5 triad
-		for fingering in temp_fingerings:
-			notes,numNotes = filter_constraint['FULL_CHORD']
-			if len(set(fingering[1]).intersection(notes)) == numNotes:
-				filtered.append(fingering)
-		temp_fingerings = filtered
-		
-	filtered = []
-	if 'NO_DEAD' in filters : #remove all with dead notes
-		for fingering in temp_fingerings:
-			if 'X' not in fingering[1]:
-				filtered.append(fingering)
-		temp_fingerings = filtered
-		
-	filtered = []
-	if 'NO_OPEN' in filters:
-		for fingering in temp_fingerings:
-			open_check = []
-			for string in fingering[0]:
-				open_check.append(string[3])
-			if 'O' not in open_check:
-				filtered.append(fingering)
-		temp_fingerings = filtered
-		
-	filtered = []
-	if 'HIGH_4' in filters:
-		for fingering in temp_fingerings:
-			validChord = True
-			for i,string in enumerate(fingering[0]):
-				if i in [0,1]:
-					if string[3] != 'X':
-						validChord = False
-						break
-				else:
-					if string[3] == 'X':
-						validChord = False
-						break
-			if validChord:
-				filtered.append(fingering)
-		temp_fingerings = filtered
-		
-	filtered = []
-	if 'LOW_4' in filters:
-		for fingering in temp_fingerings:
-			validChord = True
-			for i,string in enumerate(fingering[0]):
-				if i in [4,5]:
-					if string[3] != 'X':
-						validChord = False
-						break
-				else:
-					if string[3] == 'X':
-						validChord = False
-						break
-			if validChord:
-				filtered.append(fingering)
-		temp_fingerings = filtered
-		
-	filtered = []
-	if 'HIGH_3' in filters: #for mandolin, allow for root or 5th to be abandoned
-		for fingering in temp_fingerings:
-			validChord = True
-			for i,string in enumerate(fingering[0]):
-				if i == 0:
-					if string[3] != 'X':
-						if fingering[1][i] in ['R','#5', '5']:
-							fingering[1][i] = 'X'
-							fingering[0][i] = (fretboard.nutPosition[i][0],fretboard.nutPosition[i][1],'X','X')
-							break
-						validChord = False
-						break
-				else:
-					if string[3] == 'X':
-						validChord = False
-						break
-			if validChord:
-				filtered.append(fingering)
-		temp_fingerings = filtered
-		
-	filtered = []
-	if 'LOW_3' in filters:
-		for fingering in temp_fingerings:
-			validChord = True
-			for i,string in enumerate(fingering[0]):
-				if i == 3:
-					if string[3] != 'X':
-						if fingering[1][i] in ['R','#5','5'] :# for mandolin, allow for root or 5th to be abandoned
-							fingering[1][i] = 'X'
-							fingering[0][i] = (fretboard.nutPosition[i][0],fretboard.nutPosition[i][1],'X','X')
-							break
-						validChord = False
-						break
-				else:
-					if string[3] == 'X':
-						validChord = False
-						break
-			if validChord:
-				filtered.append(fingering)
-		temp_fingerings = filtered
-		
-	filtered = []
-	if 'DOUBLE_STOPS' in filters and instrumentType == 'mando': # create adjacent string double stops for the chords
-		numStrings = len(fingerings[0][1])
-		for fingering in temp_fingerings:
-			for i,string in enumerate(fingering[1]):
-				if i+1 == numStrings:
-					break
-				else:
-					nextString = fingering[1][i+1]
-				if string == 'X' or nextString == 'X': continue
-				if string != nextString: #rebuild the fingering as a double stop for this pair
-					field1 = []
-					field2 = []
-					field3 = []
-					j = 0
-					while j < numStrings:
-						if j < i or j > i+1:
-							field1.append((fretboard.nutPosition[j][0],fretboard.nutPosition[j][1],'X','X'))
-							field2.append('X')
-							field3.append(-1)
-							j += 1
-						else:
-							for index in [j,j+1]:
-								field1.append(fingering[0][index])
-								field2.append(fingering[1][index])
-								field3.append(fingering[2][index])
-							j += 2
-					entry = (field1,field2,field3)
-					filtered.append(entry)
-		temp_fingerings = filtered
-		
-	filtered = []
-	if 'NO_WIDOW' in filters: #remove isolated dead string (but not first or last)
-		numStrings = len(fingerings[0][1])
-		for fingering in temp_fingerings:
-			validChord = True
-			for i,string in enumerate(fingering[1]):
-				if (i == 0 or i == numStrings-1) and string == 'X' : #outside strings
-					continue
-				if string == 'X':
-					validChord = False
-					break
-			if validChord:
-				filtered.append(fingering)
-		temp_fingerings = filtered
-	unique =  uniqify(temp_fingerings,idfun=(lambda x: fingeringToString(x[2])))
-	return unique
-	
+def countText(fingerings):
+	''' number of fingerings, with a + if there may be more not found yet '''
+	if isinstance(fingerings,LazySequence) and not fingerings.complete:
+		return "{}+".format(fingerings.found)
+	return "{}".format(len(fingerings))
 	
 def tuningLabel(notes):
 	'''return the notes for the current tuning'''
@@ -1431,16 +1196,18 @@ def drawFingerboard(fingerboard):
 			markers.append(10)
 		else:
 			markers.append(9)
+		markers += [fret for fret in [15,17,19,21] if fret <= fingerboard.numFrets]
 		for index in markers:
 			markeryPos = fingerboard.fretboardYPos(index)
 			marker= PathCenteredCircle(int(0.5*fingerboard.width), markeryPos, fingerboard.markerRadius)
 			marker.fill()
 			
 			
-		markery12 = markeryPos = fingerboard.fretboardYPos(12)
-		for xfraction in [0.25,0.75]:
-			marker= PathCenteredCircle(int(xfraction*fingerboard.width), markery12, fingerboard.markerRadius)
-			marker.fill()
+		for octave in [fret for fret in [12,24] if fret <= fingerboard.numFrets]:
+			markery12 = markeryPos = fingerboard.fretboardYPos(octave)
+			for xfraction in [0.25,0.75]:
+				marker= PathCenteredCircle(int(xfraction*fingerboard.width), markery12, fingerboard.markerRadius)
+				marker.fill()
 			
 # draw strings
 
@@ -1684,6 +1451,7 @@ class Fretboard(ui.View): # display fingerboard and fingering of current chord/i
 		self._chordNumTextView = None
 		self._numChordsTextView = None
 		self.nutPositions = []
+		self._drawPositions = LRUCache(16) # layout of recently drawn fingerings
 		self.stringX = []
 		self.fretY = []
 		self.PrevFretY = 0
@@ -1723,6 +1491,7 @@ class Fretboard(ui.View): # display fingerboard and fingering of current chord/i
 						chordScale = None,
 						twoOctaveScale = None,
 						tuning=None,
+						numFrets=None,
 						type = None,
 						is5StringBanjo = False,
 						root=None,
@@ -1738,6 +1507,8 @@ class Fretboard(ui.View): # display fingerboard and fingering of current chord/i
 		self.showChordScale = showScale
 		self.ChordScale = chordScale
 		self.tuning = tuning
+		if numFrets:
+			self.numFrets = numFrets
 		self.root = self.keySignature = root
 		self.chordName = chordName
 		self.chordNoteValues = chordNoteValues
@@ -1831,10 +1602,11 @@ class Fretboard(ui.View): # display fingerboard and fingering of current chord/i
 			if self.fingerings and self.cc_mode == 'C':
 				# if there are some, draw current fingering or chord tone frets
 				if not self.showChordScale:
-					self._numChordsTextView.text = "{}".format(len(self.fingerings))
+					self._numChordsTextView.text = countText(self.fingerings)
 					self._chordNumTextView.text = "{}".format(int(self.fingeringPointer+1))
 					middle_field.text = 'of'
-					fingering,chordTones,fretPositions = self.fingerings[self.fingeringPointer]
+					current = self.fingerings[self.fingeringPointer]
+					fingering,fretPositions = self.fingeringDrawPositions(current),current.frets
 					ui.set_color('red')
 					for i,string in enumerate(fingering):
 						x,y,chordtone,nutmarker = string
@@ -2117,8 +1889,9 @@ class Fretboard(ui.View): # display fingerboard and fingering of current chord/i
 					if key[0] == string:
 						del self.touched[key]
 						break
-				self.touched[location] = (model._InstrumentTuning[string] +fret, model._InstrumentOctave,string,fret)
-				octave,tone = divmod(model._InstrumentTuning[string]+fret,12)
+				pitch = model.soundingPitch(string,fret)
+				self.touched[location] = (pitch, model._InstrumentOctave,string,fret)
+				octave,tone = divmod(pitch,12)
 				sound.play_effect(getWaveName(tone,octave+model._InstrumentOctave))
 			self.set_needs_display()
 		elif self.cc_mode == 'S': # label the two octave scale starting at this root
@@ -2155,48 +1928,60 @@ class Fretboard(ui.View): # display fingerboard and fingering of current chord/i
 				current = model._FingeringPointer
 				current += increment
 				current = max(0,current)
-				current = min(len(model._Fingerings)-1,current)
+				current = model._Fingerings.clamp(current)
 				pub.sendMessage('changefingering', pointer=current)
 			elif self.wasLongTouch: #jump to this fret
 				x,y = touch.location
-				fret = self.closest(y,self.fretY)
-				for i,fingering in enumerate(model._Fingerings):
-					_,_,frets = fingering
-					testVector =  sorted([x for x in frets if x > 0])
-					if fret - 2 <= testVector[0] <= fret + 2:
-						break
-				current = i if i < len(model._Fingerings) - 1 else self._FingeringPointer
-				pub.sendMessage('changefingering', pointer=current)
+				current = self.fingeringNearFret(self.closest(y,self.fretY))
+				if current is not None:
+					pub.sendMessage('changefingering', pointer=current)
 			else:
 				# switch display to chord tones
 				pub.sendMessage('toggleshowchordscaleview')
 			
 			
 			
+	def fingeringNearFret(self,fret):
+		''' the index of the first fingering with its lowest fretted note within 2 frets
+		of fret, or None.  Fingerings not yet found are generated one at a time, only as 
+		far as the first match'''
+		fingerings = model._Fingerings
+		if not isinstance(fingerings,LazySequence):
+			fingerings = LazySequence(fingerings or [])
+		index = 0
+		while fingerings.has(index):
+			fretted = [x for x in fingerings[index].frets if x > 0]
+			if fretted and fret - 2 <= min(fretted) <= fret + 2:
+				return index
+			index += 1
+		return None
+			
 #####################################
 # fingering positions for drawing
 
-	def fingeringDrawPositions(self,key,chordtype,tuning,fingering):
-		""" given a fingering,chord and tuning information and virtual neck info,
-		return the center positions all markers.  X and open strings will be
-		marked at the nut"""
-		scaleNotes = model.getScaleNotes(fingering)
-		#if len(scaleNotes) != len(fingering):
+	def fingeringDrawPositions(self,fingering):
+		""" given a Fingering and virtual neck info, return the center positions 
+		all markers.  X and open strings will be marked at the nut.  Only the fingering
+		being drawn is laid out, and the layout is kept until the view changes size"""
+		cacheKey = (fingering,self.width,self.height)
+		chordDrawPositions = self._drawPositions.get(cacheKey)
+		if chordDrawPositions is not None:
+			return chordDrawPositions
 		chordDrawPositions = []
 		numStrings,offset,ss = self.stringSpacing()
-		for i,fretPosition in enumerate(fingering): #loop over strings, low to high
-			try:
-				note = scaleNotes[i]
-			except:
-				continue
+		for i,(fretPosition,note) in enumerate(zip(fingering.frets,fingering.tones)): #loop over strings, low to high
 			atNut = None
 			xpos = offset + i*ss
-			if fretPosition in [-1,0]: #marker at nut
+			if fingering.isDead(i): #marker at nut
+				ypos = int(0.5* self.nutOffset)
+				atNut = 'X'
+			elif fretPosition == 0:
 				ypos = int(0.5* self.nutOffset)
-				atNut = 'X' if fretPosition else 'O'
+				atNut = 'O'
 			else:
 				ypos = self.fretboardYPos(fretPosition)
 			chordDrawPositions.append((xpos,ypos,note,atNut))
+		self._drawPositions.put(cacheKey,chordDrawPositions)
 		return chordDrawPositions
 		
 	def get_instrument(self):
@@ -2205,38 +1990,7 @@ class Fretboard(ui.View): # display fingerboard and fingering of current chord/i
 	def onFind(self,button):
 		fingered = [self.touched[key][0] for key in self.touched.keys()]
 		if fingered:
-			fingered = sorted([x%12 for x in fingered])
-			pure = []
-			missing_1 = []
-			missing_2 = []
-			chord_list = []
-			for root in range(12):
-				notes_in_key = rotate(range(12),root)
-				present = {}
-				notevals = []
-				for i,note in enumerate(notes_in_key):
-					present[i] = True if note in fingered else False
-					if present[i]:
-						notevals.append(i)
-				for chord in ccc['CHORDTYPE']:
-					deltas = set(notevals) ^ set(chord[1]) #those notes not in both (symmetric difference)
-					if not deltas:
-						pure.append({'title':"{}{}".format(ccc['NOTE_NAMES'][root],chord[0]),'root':root,
-						'chord':chord[0], 'accessory_type':'none'})
-					if deltas == set([0]):
-						missing_1.append({'title':"{}{} (no root)".format(ccc['NOTE_NAMES'][root],chord[0]),
-						'root':root, 'chord':chord[0], 'accessory_type':'none'})
-					if deltas == set([3]) or deltas == set([4]):
-						missing_1.append({'title':"{}{} (no 3rd)".format(ccc['NOTE_NAMES'][root],chord[0]),
-						'root':root, 'chord':chord[0], 'accessory_type':'none'})
-					if deltas == set([7]):
-						missing_1.append({'title':"{}{} (no 5th)".format(ccc['NOTE_NAMES'][root],chord[0]),
-						'root':root, 'chord':chord[0], 'accessory_type':'none'})
-						
-			for list in [pure,missing_1]:
-				if list:
-					chord_list += list
-					chord_list.append({'title':"-------",'root':-1, 'chord':-1, 'accessory_type':'none'})
+			chord_list = findChords(fingered,min(fingered))
 			pub.sendMessage('updatefind',chordlist=chord_list)
 
 
@@ -2252,6 +2006,11 @@ class Chord(TVTools,object):
 		self.items = items
 		self.delegator = mainView['tableview_type']
 		self._current = None
+		self.buildIndex()
+		
+	def buildIndex(self):
+		''' the chord identification table, rebuilt whenever the chord types are edited'''
+		self.index = ChordIndex([(item['title'],item['fingering']) for item in self.items])
 		
 	def onEdit(self,button):
 		if self.delegator.editing:
@@ -2307,10 +2066,12 @@ class Chord(TVTools,object):
 		self.currentNumLines -=1 # see above regarding hte "syncing"
 		self.delegator.delete_rows((row,)) # this animates the deletion  could also 'tableview.reload_data()'
 		del self.items[row]
+		self.buildIndex()
 		
 	def tableview_move_row(self, tableview, from_section, from_row, to_section, to_row):
 		# Called when the user moves a row with the reordering control (in editing mode).
 		self.items = listShuffle(self.items,from_row,to_row)
+		self.buildIndex()
 		
 	def get_chord(self):
 		return self.chord
@@ -2760,9 +2521,8 @@ def parseChordName(chordstr):
 def onPrevNext(button):
 	if model._Fingerings:
 		cn = model._FingeringPointer
-		nc = len(model._Fingerings)
 		if button.name == 'button_down':
-			if cn < nc-1:
+			if model._Fingerings.has(cn+1): # only finds as far as the next one
 				cn +=1
 		else:
 			cn -= 1
@@ -2793,8 +2553,8 @@ def play(button):
 				return
 			except IndexError: #oops
 				return
-			frets = cc[2]
-			dead_notes = [item[3] == 'X' for item in cc[0]]
+			frets = cc.frets
+			dead_notes = [cc.isDead(i) for i in range(len(frets))]
 			tones = []
 			for fret,string,dead_note in zip(frets,strings,dead_notes):
 				if  dead_note:
@@ -2852,20 +2612,20 @@ def toggle_mode(sender,row):
 	
 	newmode = sender.current['tag']
 	hideshow = {'I':  {'hide':
-	'tableview_root tableview_type tableview_scale label1 button_scale_notes button_scale_tones chord_num label_middle button_play_scale num_chords lbl_chord lbl_fullchord lbl_definition btn_sharpFlat sp_span lbl_span tri_chord_label  button_up button_down'.split(),
+	'tableview_root tableview_type tableview_scale label1 button_scale_notes button_scale_tones chord_num label_middle button_play_scale num_chords lbl_chord lbl_fullchord lbl_definition btn_sharpFlat sp_span lbl_span tri_chord_label  button_up button_down sc_engine sc_ranking sc_workers'.split(),
 	'show':
-	('tableview_find', 'button_find', 'button_chord', 'button_arp', 'fretboard')
+	('tableview_find', 'button_find', 'button_chord', 'button_arp', 'fretboard', 'sc_findranking', 'button_findwave')
 	},
 	'C':    {'hide':
-	'tableview_find button_find button_scale_tones button_scale_notes tableview_scale button_play_scale lbl_chord lbl_fullchord btn_sharpFlat'.split(),
-	'show': 'tableview_root tableview_type label1 chord_num num_chords label_middle button_chord button_arp sp_span lbl_span tri_chord_label button_up button_down label1 fretboard'.split()
+	'tableview_find button_find button_scale_tones button_scale_notes tableview_scale button_play_scale lbl_chord lbl_fullchord btn_sharpFlat sc_findranking button_findwave'.split(),
+	'show': 'tableview_root tableview_type label1 chord_num num_chords label_middle button_chord button_arp sp_span lbl_span tri_chord_label button_up button_down label1 fretboard sc_engine sc_ranking sc_workers'.split()
 	},
 	'S':    {'hide':
-	'tableview_type tableview_find button_find chord_num num_chords label_middle button_chord button_arp lbl_chord lbl_fullchord lbl_definition sp_span lbl_span button_up button_down'.split(),
+	'tableview_type tableview_find button_find chord_num num_chords label_middle button_chord button_arp lbl_chord lbl_fullchord lbl_definition sp_span lbl_span button_up button_down sc_engine sc_ranking sc_workers sc_findranking button_findwave'.split(),
 	'show': 'tableview_scale tableview_root button_scale_tones button_scale_notes button_play_scale btn_sharpFlat tri_chord_label label1 fretboard'.split(),
 	},
 	'P':    {'hide':
-	'tableview_find button_find button_scale_tones button_scale_notes tableview_scale button_play_scale lbl_chord lbl_fullchord btn_sharpFlat tableview_type tableview_root label1 fretboard'.split(),
+	'tableview_find button_find button_scale_tones button_scale_notes tableview_scale button_play_scale lbl_chord lbl_fullchord btn_sharpFlat tableview_type tableview_root label1 fretboard sc_engine sc_ranking sc_workers sc_findranking button_findwave'.split(),
 	'show': 'chord_num num_chords label_middle button_chord button_arp sp_span lbl_span tri_chord_label button_up button_down'.split()
 	},
 	}
@@ -2894,6 +2654,7 @@ def toggle_mode(sender,row):
 		tvFind.reload_data()
 		fretboard.findScaleNotes = []
 		find.row = -1
+		find.query = None
 		fretboard.touched = {}
 	fretboard.set_needs_display()
 	mainView.set_needs_display()
@@ -2903,41 +2664,32 @@ def set_scale_display(button):
 	fretboard.scale_display_mode = button.title
 	fretboard.set_needs_display()
 	
+def findChords(fingered,bass=None):
+	''' the chords the fingered notes make, ranked if model._FindLimit, else named over
+	the bass, the lowest sounding note'''
+	find.query = (fingered,bass)
+	if model._FindLimit:
+		return chord.index.rank(fingered,ccc['NOTE_NAMES'],model._FindLimit)
+	return chord.index.identify(fingered,ccc['NOTE_NAMES'],bass)
+	
+def findWave(path=None):
+	''' identify the chord of a mono WAV recording (e.g. one from makeWaves.py) from the
+	dominant pitch classes of its chromagram, the chords go to the find table'''
+	if not ccengine.audio.available:
+		console.hud_alert('numpy not available, can\'t read recordings','error',2)
+		return
+	try:
+		notes,bass = ccengine.audio.waveNotes(path)
+	except (ValueError,OSError,EOFError):
+		console.hud_alert('can\'t read {}'.format(path),'error',2)
+		return
+	if notes:
+		pub.sendMessage('updatefind',chordlist=findChords(notes,bass))
+	
 def onFind(button):
 	fingered = [fretboard.touched[key][0] for key in fretboard.touched.keys()]
 	if fingered:
-		fingered = sorted([x%12 for x in fingered])
-		pure = []
-		missing_1 = []
-		missing_2 = []
-		chord_list = []
-		for root in range(12):
-			notes_in_key = rotate(range(12),root)
-			present = {}
-			notevals = []
-			for i,note in enumerate(notes_in_key):
-				present[i] = True if note in fingered else False
-				if present[i]:
-					notevals.append(i)
-			for chord in ccc['CHORDTYPE']:
-				deltas = set(notevals) ^ set(chord[1]) #those notes not in both (symmetric difference)
-				if not deltas:
-					pure.append({'title':"{}{}".format(ccc['NOTE_NAMES'][root],chord[0]),'root':root,
-					'chord':chord[0], 'accessory_type':'none'})
-				if deltas == set([0]):
-					missing_1.append({'title':"{}{} (no root)".format(ccc['NOTE_NAMES'][root],chord[0]),
-					'root':root, 'chord':chord[0], 'accessory_type':'none'})
-				if deltas == set([3]) or deltas == set([4]):
-					missing_1.append({'title':"{}{} (no 3rd)".format(ccc['NOTE_NAMES'][root],chord[0]),
-					'root':root, 'chord':chord[0], 'accessory_type':'none'})
-				if deltas == set([7]):
-					missing_1.append({'title':"{}{} (no 5th)".format(ccc['NOTE_NAMES'][root],chord[0]),
-					'root':root, 'chord':chord[0], 'accessory_type':'none'})
-					
-		for list in [pure,missing_1]:
-			if list:
-				chord_list += list
-				chord_list.append({'title':"-------",'root':-1, 'chord':-1, 'accessory_type':'none'})
+		chord_list = findChords(fingered,min(fingered))
 		tvFind.data_source.items = chord_list
 		tvFind.data_source.currentNumLines = len(chord_list)
 		tvFind.hidden = False
@@ -2954,6 +2706,32 @@ def on_slider_arp(sender):
 def onSpanSpinner(sender):
 	''' repond to changes in span'''
 	pub.sendMessage('changespan',data=sender.value)
+	
+def onFindWave(button):
+	''' ask for a recording and identify its chord'''
+	try:
+		path = console.input_alert('identify a recording','path of a mono WAV file','','find')
+	except KeyboardInterrupt:
+		return
+	pub.sendMessage('findwave',path=path)
+	
+def addSegmentedControl(name,frame,choices,message,key):
+	''' add a segmented control of the (title, value) choices to the main view, selecting
+	one sends message with key= its value'''
+	control = ui.SegmentedControl(frame=frame,name=name)
+	control.segments = [title for title,value in choices]
+	control.selected_index = 0
+	def action(sender):
+		pub.sendMessage(message,**{key:choices[sender.selected_index][1]})
+	control.action = action
+	mainView.add_subview(control)
+	return control
+	
+def syncSegmentedControl(control,choices,value):
+	''' select the choice with value, after the model has overridden a selection'''
+	values = [choice[1] for choice in choices]
+	if value in values:
+		control.selected_index = values.index(value)
 
 #--- =====================
 	
@@ -3029,11 +2807,13 @@ class Find(object):
 		self.row = -1
 		self.key = None
 		self.chord = None
+		self.query = None # (notes, bass) of the last find, see findChords
 		pub.subscribe(self.updateFind,'updatefind')
 		
 	def reset(self):
 		self.items = []
 		self.row = -1
+		self.query = None
 		fretboard.findScaleNotes= {}
 		self.delegator.reload_data()
 		
@@ -3187,6 +2967,7 @@ class InstrumentEditor(ui.View):
 			
 		entry['notes'] = notes
 		entry['span'] = int(self.SpanSpinner.value)
+		entry['frets'] = cccInit.NUM_FRETS_DEFAULT
 		entry['accessory_type'] = 'none'
 		pub.sendMessage('addnewinstrument',entry=entry)
 		
@@ -3505,6 +3286,7 @@ if __name__ == "__main__":
 	tvFind.data_source = find
 	tvFind.delegate = find
 	tvFind.hidden = True
+	pub.subscribe(findWave,'findwave')
 	
 	tvScale = mainView['tableview_scale']
 	tvScale.data_source.items = []
@@ -3575,5 +3357,24 @@ if __name__ == "__main__":
 							)
 
 	mainView.add_subview(modeDropDown)
+	
+	# search and identify options, under the fretboard
+	engineControl = addSegmentedControl('sc_engine',(272,672,128,29),ENGINE_CHOICES,'changeengine','engine')
+	addSegmentedControl('sc_ranking',(408,672,137,29),RANKING_CHOICES,'changeranking','limit')
+	workersControl = addSegmentedControl('sc_workers',(272,706,273,29),WORKER_CHOICES,'changeworkers','workers')
+	
+	def syncEngine(engine=None):
+		syncSegmentedControl(engineControl,ENGINE_CHOICES,engine)
+	pub.subscribe(syncEngine,'syncengine')
+	
+	def syncWorkers(workers=0):
+		syncSegmentedControl(workersControl,WORKER_CHOICES,workers)
+	pub.subscribe(syncWorkers,'syncworkers')
+	
+	addSegmentedControl('sc_findranking',(272,672,273,29),FIND_RANKING_CHOICES,'changefindranking','limit')
+	findWaveButton = ui.Button(frame=(272,706,273,29),name='button_findwave',title='identify a recording')
+	findWaveButton.action = onFindWave
+	mainView.add_subview(findWaveButton)
+	
 	toggle_mode(modeDropDown,0) # default to calc
 	mainView.present(style='full_screen',orientations=('landscape',))
@@ -261,6 +261,10 @@ SPAN_DEFAULT_BASS = 3
 SPAN_DEFAULT_UKULELE = 5
 SPAN_DEFAULT_MANDOLIN = 7
 
+# Neck length in frets, a TUNINGS entry can give its own as a 4th item
+NUM_FRETS_DEFAULT = 14
+NUM_FRETS_EXTENDED = 24
+
 TUNINGS = [
 	# Guitar
 	('GUITAR', [[NOTE_E, NOTE_A, NOTE_D+12, NOTE_G+12, NOTE_B+12, NOTE_E+24], SPAN_DEFAULT_GUITAR],2),
@@ -295,6 +299,9 @@ TUNINGS = [
 	('GUITAR_SLACK_C', [[NOTE_C, NOTE_G, NOTE_C+12, NOTE_E+12, NOTE_A+12, NOTE_C+24], SPAN_DEFAULT_GUITAR],2),
 	('GUITAR_WAHINE1', [[NOTE_C, NOTE_G, NOTE_D+12, NOTE_G+12, NOTE_B+12, NOTE_D+24], SPAN_DEFAULT_GUITAR],2),
 	('GUITAR_WAHINE2', [[NOTE_D, NOTE_A, NOTE_D+12, NOTE_Fs+12, NOTE_A+12, NOTE_Cs+24], SPAN_DEFAULT_GUITAR],2),
+	# Extended range guitars
+	('GUITAR 7 Str', [[NOTE_B, NOTE_E+12, NOTE_A+12, NOTE_D+24, NOTE_G+24, NOTE_B+24, NOTE_E+36], SPAN_DEFAULT_GUITAR],1,NUM_FRETS_EXTENDED),
+	('GUITAR 8 Str', [[NOTE_Fs, NOTE_B, NOTE_E+12, NOTE_A+12, NOTE_D+24, NOTE_G+24, NOTE_B+24, NOTE_E+36], SPAN_DEFAULT_GUITAR],1,NUM_FRETS_EXTENDED),
 	# Bass
 	('BASS', [[NOTE_E, NOTE_A, NOTE_D+12, NOTE_G+12], SPAN_DEFAULT_BASS],0),
 	# Ukulele
@@ -341,8 +348,9 @@ SOUND_FILE = [
               ],
              ]
 
-TUNING_LIST_CLEAN = [{'title':title, 'notes':ns[0], 'span':ns[1], 'octave':oct,'accessory_type':'none'} 
-for title,ns,oct in TUNINGS]
+TUNING_LIST_CLEAN = [{'title':tuning[0], 'notes':tuning[1][0], 'span':tuning[1][1], 'octave':tuning[2],
+'frets':tuning[3] if len(tuning) > 3 else NUM_FRETS_DEFAULT, 'accessory_type':'none'} 
+for tuning in TUNINGS]
 	
 
 
@@ -0,0 +1,26 @@
+''' capos on instruments with more strings than the capo masks'''
+
+import os, sys, unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chordcalc_constants
+from ccengine.capos import capoOffsets
+
+def capoMask(title):
+	return [capo['mask'] for capo in chordcalc_constants.CAPOS if capo['title'] == title][0]
+
+class TestCapoOffsets(unittest.TestCase):
+	def test_full_capo_on_6_strings(self):
+		self.assertEqual(capoOffsets({2:capoMask('Full Capo')},6),(2,)*6)
+
+	def test_capo_on_7_string_guitar(self):
+		# the masks cover 6 strings, the 7th is left open
+		self.assertEqual(capoOffsets({2:capoMask('Full Capo')},7),(2,2,2,2,2,2,0))
+		self.assertEqual(capoOffsets({2:capoMask('Full Capo'),4:capoMask('Sus2')},7),(2,4,4,4,2,2,0))
+
+	def test_capo_on_8_string_guitar(self):
+		self.assertEqual(capoOffsets({3:capoMask('"Dropped D"')},8),(0,3,3,3,3,3,0,0))
+
+if __name__ == '__main__':
+	unittest.main()
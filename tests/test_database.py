@@ -0,0 +1,71 @@
+''' the fingering database treats files from older versions as stale, and is rebuilt one
+tuning at a time'''
+
+import os, sys, json, struct, tempfile, unittest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ccengine import database
+
+def writeHeader(path,header):
+	headerBytes = json.dumps(header).encode()
+	with open(path,'wb') as fh:
+		fh.write(database.DB_MAGIC)
+		fh.write(struct.pack('<I',len(headerBytes)))
+		fh.write(headerBytes)
+
+class TestStaleDatabase(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.dir,'fingerings.db')
+
+	def tearDown(self):
+		os.remove(self.path)
+		os.rmdir(self.dir)
+
+	def test_version1_header_is_stale(self):
+		# as built by version 1, one numFrets for every tuning and no 'frets' list
+		writeHeader(self.path,{'version':1, 'signature':database.sourceSignature(), 'recordWidth':3,
+						'tunings':['4,9,14,19,23,28'], 'spans':[5], 'numFrets':14, 'chords':['0,4,7']})
+		with self.assertRaises(ValueError):
+			database.FingeringDB(self.path)
+		self.assertIsNone(database.openCurrent(self.path))
+
+	def test_header_missing_keys_is_stale(self):
+		writeHeader(self.path,{'version':database.DB_VERSION})
+		self.assertIsNone(database.openCurrent(self.path))
+
+class TestTuningRebuild(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.dir,'fingerings.db')
+
+	def tearDown(self):
+		for name in os.listdir(self.dir):
+			os.remove(os.path.join(self.dir,name))
+		os.rmdir(self.dir)
+
+	def test_signature_ignores_working_directory(self):
+		signature = database.sourceSignature()
+		cwd = os.getcwd()
+		os.chdir(self.dir)
+		try:
+			self.assertEqual(database.sourceSignature(),signature)
+		finally:
+			os.chdir(cwd)
+
+	def test_rebuild_builds_only_the_tuning(self):
+		guitar = ((4,9,14,19,23,28),False)
+		self.assertTrue(database.rebuildInBackground(self.path,tuning=guitar))
+		database._rebuilding[0].join()
+		self.assertEqual(os.listdir(self.dir),[os.path.basename(database.tuningPath(self.path,*guitar))])
+		db = database.openCurrent(database.tuningPath(self.path,*guitar))
+		self.assertEqual(list(db._tunings),['4,9,14,19,23,28'])
+		self.assertTrue(list(db.lookup(list(guitar[0]),False,0,[0,4,7],db._spans[0],14)))
+		db.close()
+
+	def test_rebuild_skips_tunings_not_in_the_catalog(self):
+		self.assertFalse(database.rebuildInBackground(self.path,tuning=((1,2,3),False)))
+
+if __name__ == '__main__':
+	unittest.main()